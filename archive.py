@@ -0,0 +1,256 @@
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import hashlib
+import json
+import mmap
+import re
+import struct
+import threading
+import time
+import zlib
+
+from config import config
+from transport import Transport
+
+try:
+    import fcntl
+except ImportError:
+    # no lock between processes: only one scrapper process can write to an archive at a time
+    fcntl = None
+
+PAGE_TYPES = ('ResultsPage', 'ProductPage', 'QuestionsPage', 'AnswersPage')
+CODECS = ('zlib', 'zstd')
+
+# index entry: url key, offset and size of the record in the data file, fetch time, status, page type, codec
+IndexEntry = namedtuple('IndexEntry', ['key', 'offset', 'size', 'fetched_at', 'status', 'page_type', 'codec'])
+INDEX_ENTRY = struct.Struct('<16sQIdHBB')
+# data record: header and content sizes, followed by the JSON header and the compressed content
+RECORD_SIZES = struct.Struct('<II')
+
+ArchivedResponse = namedtuple('ArchivedResponse', ['status_code', 'content', 'headers'])
+
+
+def url_key(url: str, language: str):
+    return hashlib.blake2b(f"{language} {url}".encode("utf-8"), digest_size=16).digest()
+
+
+class ResponseArchive:
+    """
+    Append-only archive of the raw responses fetched, with their url, language, page type, status and fetch time.
+    Records are compressed one by one in a data file, and found through a fixed size index, read memory-mapped,
+    so that the pages can be extracted again at any time without requesting them
+    """
+
+    def __init__(self, path="archive", compression='zlib', level=6):
+        """
+        :param path:
+        directory of the archive, holding responses.dat and responses.idx
+        :param compression:
+        zlib, or zstd (requires the zstandard package)
+        """
+        if compression not in CODECS:
+            raise ValueError(f"Unknown archive compression {compression}, use one of {', '.join(CODECS)}")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.path / 'responses.dat'
+        self.index_path = self.path / 'responses.idx'
+        self.compression = compression
+        self.level = level
+
+        self.lock = threading.Lock()
+        self._data = None
+        self._index = None
+        self._keys = None
+        self._latest = None
+        self._data_map = None
+
+    @staticmethod
+    def from_config():
+        """
+        :return:
+        a new ResponseArchive with the settings from the config file, or None if the archive is disabled
+        """
+        settings = config['archive']
+        if not settings['enabled']:
+            return None
+        return ResponseArchive(settings['path'], settings['compression'], settings['level'])
+
+    def _compress(self, content: bytes):
+        if self.compression == 'zstd':
+            from writer import import_zstandard
+            return import_zstandard().ZstdCompressor(level=self.level).compress(content)
+        return zlib.compress(content, self.level)
+
+    @staticmethod
+    def _decompress(content: bytes, codec: int):
+        if CODECS[codec] == 'zstd':
+            from writer import import_zstandard
+            return import_zstandard().ZstdDecompressor().decompress(content)
+        return zlib.decompress(content)
+
+    def append(self, url: str, language: str, page_type: str, status: int, content: bytes):
+        """
+        Adds a response at the end of the archive.
+        The record is written before its index entry, so a crash leaves at most an unindexed record
+        """
+        fetched_at = time.time()
+        header = json.dumps({'url': url, 'language': language, 'page': page_type, 'status': status,
+                             'fetched_at': fetched_at}).encode("utf-8")
+        body = self._compress(content)
+        record = RECORD_SIZES.pack(len(header), len(body)) + header + body
+
+        with self.lock:
+            if self._data is None:
+                self._data = open(self.data_path, 'ab')
+                self._index = open(self.index_path, 'ab')
+            if fcntl:
+                fcntl.flock(self._index, fcntl.LOCK_EX)
+            try:
+                self._data.seek(0, 2)
+                offset = self._data.tell()
+                self._data.write(record)
+                self._data.flush()
+                self._index.write(INDEX_ENTRY.pack(url_key(url, language), offset, len(record), fetched_at, status,
+                                                   PAGE_TYPES.index(page_type), CODECS.index(self.compression)))
+                self._index.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(self._index, fcntl.LOCK_UN)
+
+            if self._keys is not None:
+                self._keys.add(url_key(url, language))
+
+    def entries(self):
+        """
+        :return:
+        the index entries, in the order they were added, read from the memory-mapped index
+        """
+        if not self.index_path.exists() or self.index_path.stat().st_size < INDEX_ENTRY.size:
+            return
+
+        with open(self.index_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            # an entry being written by another process is left out
+            complete = len(index) - len(index) % INDEX_ENTRY.size
+            for position in range(0, complete, INDEX_ENTRY.size):
+                yield IndexEntry(*INDEX_ENTRY.unpack_from(index, position))
+
+    def contains(self, url: str, language: str):
+        """
+        :return:
+        whether the archive holds a response for the url, as of when it was first checked, plus the ones added since
+        """
+        with self.lock:
+            if self._keys is None:
+                self._keys = {entry.key for entry in self.entries()}
+            return url_key(url, language) in self._keys
+
+    def latest(self):
+        """
+        :return:
+        {url key: index entry} of the last response archived for each url and language
+        """
+        if self._latest is None:
+            self._latest = {entry.key: entry for entry in self.entries()}
+        return self._latest
+
+    def _map(self, entry: IndexEntry):
+        """
+        :return:
+        the memory-mapped data file, holding the record of the index entry
+        """
+        if self._data_map is None or entry.offset + entry.size > len(self._data_map):
+            # mapped again when the record was added after the data file was mapped
+            if self._data_map is not None:
+                self._data_map.close()
+            with open(self.data_path, 'rb') as f:
+                self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data_map
+
+    def read_header(self, entry: IndexEntry):
+        """
+        :return:
+        the header of the record of the index entry, without decompressing its content
+        """
+        data_map = self._map(entry)
+        header_size, _ = RECORD_SIZES.unpack_from(data_map, entry.offset)
+        start = entry.offset + RECORD_SIZES.size
+        return json.loads(data_map[start:start + header_size])
+
+    def read(self, entry: IndexEntry):
+        """
+        :return:
+        (header, content) of the record of the index entry, read from the memory-mapped data file
+        """
+        data_map = self._map(entry)
+        header_size, body_size = RECORD_SIZES.unpack_from(data_map, entry.offset)
+        start = entry.offset + RECORD_SIZES.size
+        header = json.loads(data_map[start:start + header_size])
+        content = self._decompress(data_map[start + header_size:start + header_size + body_size], entry.codec)
+        return header, content
+
+    def get(self, url: str, language: str):
+        """
+        :return:
+        the last response archived for the url and language, or None if there is none
+        """
+        entry = self.latest().get(url_key(url, language))
+        if entry is None:
+            return None
+        _, content = self.read(entry)
+        return ArchivedResponse(entry.status, content, {})
+
+    def product_ids(self, page_type='ProductPage'):
+        """
+        :return:
+        [(language, product id)] of the products with a page of the type archived, in the order first archived
+        """
+        pattern = r"/dp/(\w+)/" if page_type == 'ProductPage' else r"/ask/questions/asin/(\w+)/"
+        products = {}
+        for entry in self.latest().values():
+            if PAGE_TYPES[entry.page_type] != page_type:
+                continue
+            header = self.read_header(entry)
+            match = re.search(pattern, header['url'])
+            if match:
+                products.setdefault((header['language'], match.group(1)), entry.fetched_at)
+        return sorted(products, key=products.get)
+
+    def close(self):
+        with self.lock:
+            if self._data is not None:
+                self._data.close()
+                self._index.close()
+                self._data = self._index = None
+        if self._data_map is not None:
+            self._data_map.close()
+            self._data_map = None
+
+
+class ArchiveTransport(Transport):
+    """
+    Transport that takes every page from the archive, without any request.
+    A page missing from the archive is an error
+    """
+
+    def __init__(self, source: ResponseArchive, language: str):
+        # pages read from the archive are not archived again
+        super().__init__({'Accept-Language': language})
+        self.source = source
+
+    def get(self, url, headers=None):
+        r = self.source.get(url, self.language)
+        if r is None:
+            raise LookupError(f"{url} is not in the archive")
+        return r
+
+
+@lru_cache
+def archive_transport(path: str, language: str):
+    """
+    :return:
+    the transport reading from the archive in the path, one per process and language
+    """
+    return ArchiveTransport(ResponseArchive(path), language)
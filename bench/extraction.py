@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of card extraction: finds the fields of every question and answer card of fixture pages,
+with one select_one query per field, and with the card fields of each page class in a single walk of the card.
+Run it from the project root:
+
+    python bench/extraction.py
+    python bench/extraction.py --cards 50 --repeat 20 --parser html.parser
+"""
+from pathlib import Path
+
+import argparse
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from server import Catalog
+from page import AnswersPage, QuestionsPage, ResultsPage
+
+
+def select_one_fields(card, selectors: dict):
+    """
+    The fields of the card found as before the card fields: one select_one query each
+    """
+    found = {name: card.select_one(selector) for name, selector in selectors.items() if name != 'question_link'}
+    if 'question_link' in selectors:
+        found['question_link'] = found['question'].select_one(selectors['question_link']) if found['question'] else None
+    return found
+
+
+def per_card_microseconds(cards, extract, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for card in cards:
+            extract(card)
+        best = min(best, time.perf_counter() - start)
+    return best / len(cards) * 1e6
+
+
+# page class, page from the catalog, and the locators that the card fields replace
+CASES = {
+    'results': (ResultsPage, lambda catalog: catalog.results('en', 'time machine', 1),
+                {'link': ResultsPage.product_link_locator}),
+    'questions': (QuestionsPage, lambda catalog: catalog.questions('en', 'B00100000X', 1),
+                  {'question': QuestionsPage.question_locator, 'question_link': QuestionsPage.question_link_locator,
+                   'votes': QuestionsPage.votes_locator, 'answer_count': QuestionsPage.answer_count_locator}),
+    'answers': (AnswersPage, lambda catalog: catalog.answers('en', 'B00100000XQ001000', 1),
+                {'text': AnswersPage.text_locator, 'date': AnswersPage.date_locator,
+                 'badge': AnswersPage.badge_locator, 'votes': AnswersPage.votes_locator}),
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compares per-card extraction with select_one and card fields")
+    parser.add_argument("--cards", type=int, default=20, help="Cards per fixture page")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs of each method, the fastest one is reported")
+    parser.add_argument("--parser", default="lxml", help="BeautifulSoup parser backend")
+    args = parser.parse_args()
+
+    catalog = Catalog(products_per_page=args.cards, questions_per_page=args.cards, answers_per_page=args.cards)
+
+    print(f"{'page':>10} | {'cards':>5} | {'select_one us/card':>18} | {'card fields us/card':>19} | {'speedup':>7}")
+    for case, (page_type, content, selectors) in CASES.items():
+        soup = BeautifulSoup(content(catalog), args.parser)
+        cards = soup.select(page_type.product_locator if page_type is ResultsPage else page_type.card_locator)
+        fields = page_type.product_fields if page_type is ResultsPage else page_type.card_fields
+
+        # both ways must find the very same tags
+        for card in cards:
+            expected, found = select_one_fields(card, selectors), fields.extract(card)
+            if any(found[name] is not tag for name, tag in expected.items()):
+                raise AssertionError(f"Card fields differ from select_one in {case} page: {card}")
+
+        before = per_card_microseconds(cards, lambda card: select_one_fields(card, selectors), args.repeat)
+        after = per_card_microseconds(cards, fields.extract, args.repeat)
+        print(f"{case:>10} | {len(cards):>5} | {before:>18.1f} | {after:>19.1f} | {before / after:>6.1f}x")
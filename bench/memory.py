@@ -0,0 +1,115 @@
+"""
+Memory check: runs a long sequential crawl of main.py against the local replay server, sampling the RSS of the
+scrapper, and fails if it keeps growing once the crawl is warmed up. Linux only, as RSS is read from /proc.
+Run it from the project root:
+
+    python bench/memory.py
+    python bench/memory.py --results-pages 20 --max-growth-mb 30 --main-args="--async"
+"""
+from pathlib import Path
+
+import argparse
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).parent))
+from run import ROOT, write_config
+from server import add_arguments, server_from_args
+
+CHECKPOINTS = (0.1, 0.25, 0.5, 0.75, 1.0)
+
+
+def rss_mb(pid: int):
+    """
+    :return:
+    the resident set size of the process in MB, or None if it already ended
+    """
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def sample_crawl(server, args):
+    """
+    Runs main.py in sequential mode over all the products of the server
+    :return:
+    (products fetched, RSS MB) samples, taken every args.interval seconds
+    """
+    total_products = len(server.catalog.product_ids())
+    samples = []
+
+    with tempfile.TemporaryDirectory(prefix="bench-memory-") as directory:
+        directory = Path(directory)
+        write_config(directory, server)
+
+        command = [sys.executable, str(ROOT / 'main.py'), '-g', '-1', '-p', '-1',
+                   '-q', str(args.max_questions), '-a', str(args.max_answers)] + shlex.split(args.main_args)
+        products_before = server.request_counts().get('product', 0)
+        process = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        while process.poll() is None:
+            rss = rss_mb(process.pid)
+            if rss is not None:
+                products = server.request_counts().get('product', 0) - products_before
+                samples.append((products, rss))
+                print(f"\r{products}/{total_products} products, {rss:.1f} MB", end="", file=sys.stderr, flush=True)
+            time.sleep(args.interval)
+        print(file=sys.stderr)
+
+        if process.returncode != 0:
+            raise RuntimeError(f"main.py failed:\n{process.stderr.read().decode(errors='replace')}")
+
+    return samples
+
+
+def rss_at(samples, products: int):
+    """
+    :return:
+    the highest RSS sampled up to the given number of products
+    """
+    return max((rss for fetched, rss in samples if fetched <= products), default=0.0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Checks that the RSS of a long crawl stays flat")
+    parser.add_argument("--main-args", default="", help="Extra arguments for main.py, e.g. --main-args='--async'")
+    parser.add_argument("-q", "--max-questions", type=int, default=5)
+    parser.add_argument("-a", "--max-answers", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between RSS samples")
+    parser.add_argument("--warm-up", type=float, default=0.25,
+                        help="Share of the products after which the RSS must stay flat")
+    parser.add_argument("--max-growth-mb", type=float, default=25,
+                        help="Max RSS growth allowed from the end of the warm up to the end of the crawl")
+    add_arguments(parser)
+    # 63 results pages of 16 products: a 1,008 products crawl, with light pages to keep it short
+    parser.set_defaults(results_pages=63, questions_pages=1, questions_per_page=5, answers_pages=1,
+                        answers_per_page=5, product_size_kb=200)
+    args = parser.parse_args()
+
+    replay_server = server_from_args(args).start()
+    try:
+        crawl_samples = sample_crawl(replay_server, args)
+    finally:
+        replay_server.stop()
+
+    total = crawl_samples[-1][0] if crawl_samples else 0
+    print(f"{'products':>10} | {'RSS MB':>8}")
+    for checkpoint in CHECKPOINTS:
+        products = int(total * checkpoint)
+        print(f"{products:>10} | {rss_at(crawl_samples, products):>8.1f}")
+
+    warmed_up = rss_at(crawl_samples, int(total * args.warm_up))
+    growth = max(rss for _, rss in crawl_samples) - warmed_up
+    flat = growth <= args.max_growth_mb
+    print(f"RSS growth after the first {args.warm_up:.0%} of the products: {growth:+.1f} MB,"
+          f" max {args.max_growth_mb:.0f} MB {'OK' if flat else 'EXCEEDED'}")
+
+    sys.exit(0 if flat else 1)
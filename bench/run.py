@@ -0,0 +1,190 @@
+"""
+Offline benchmark: runs main.py end to end against the local replay server, and reports
+pages/sec, questions/sec, CPU time and peak RSS of each mode.
+Run it from the project root:
+
+    python bench/run.py
+    python bench/run.py --modes scrap-prod-ids --main-args="--async" --latency 0.05 --save before.json
+    python bench/run.py --modes scrap-prod-ids --main-args="--async" --latency 0.05 --compare before.json
+"""
+from pathlib import Path
+
+import argparse
+import copy
+import gzip
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server import add_arguments, server_from_args
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = ('save-prod-ids', 'scrap-prod-ids', 'sequential')
+
+# settings that keep the scrapper from waiting on purpose, or from reading pages from previous runs
+BENCH_CONFIG = {
+    'debug': False,
+    'rate-limit': {'initial-rate': 1000, 'min-rate': 100, 'max-rate': 1000, 'burst': 100,
+                   'backoff-base': 0.05, 'backoff-max': 0.5},
+    'cache': {'enabled': False},
+    'metrics': {'enabled': False},
+}
+
+
+def merged(base: dict, overrides: dict):
+    result = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merged(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def count_output(directory: Path):
+    """
+    :return:
+    number of questions and product ids in the output files of a run
+    """
+    questions = 0
+    product_ids = 0
+    for file in directory.iterdir():
+        if file.name.endswith('.json'):
+            records = json.loads(file.read_text(encoding="utf-8"))
+            questions += len(records) if isinstance(records, list) else 0
+        elif file.name.endswith('.jsonl') or file.name.endswith('.jsonl.gz'):
+            opener = gzip.open if file.name.endswith('.gz') else open
+            with opener(file, 'rt', encoding="utf-8") as f:
+                questions += sum(1 for line in f if line.strip())
+        elif file.name.startswith('prod_ids') and file.name.endswith('.txt'):
+            product_ids += sum(1 for line in file.read_text().split('\n') if line)
+    return questions, product_ids
+
+
+def write_config(directory: Path, server):
+    """
+    Writes a copy of the config file in the directory, pointing to the replay server
+    """
+    with open(ROOT / 'config.yml', 'r') as f:
+        settings = merged(yaml.safe_load(f), BENCH_CONFIG)
+    settings['request']['url-base'] = server.url
+    with open(directory / 'config.yml', 'w') as f:
+        yaml.safe_dump(settings, f)
+
+
+def run_mode(mode: str, server, args):
+    """
+    Runs main.py in a new directory, with the config file pointing to the replay server
+    :return:
+    the measures of the run
+    """
+    with tempfile.TemporaryDirectory(prefix=f"bench-{mode}-") as directory:
+        directory = Path(directory)
+        write_config(directory, server)
+
+        command = [sys.executable, str(ROOT / 'main.py'), '-g', str(args.max_pages), '-p', str(args.max_products),
+                   '-q', str(args.max_questions), '-a', str(args.max_answers)]
+        if mode == 'save-prod-ids':
+            command.append('--save-prod-ids')
+        elif mode == 'scrap-prod-ids':
+            product_ids = server.catalog.product_ids()
+            (directory / 'products.txt').write_text("\n".join(product_ids) + "\n")
+            command += ['--scrap-prod-ids', 'products.txt']
+        command += shlex.split(args.main_args)
+
+        requests_before = server.request_counts()
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        stderr = process.stderr.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+
+        if status != 0:
+            raise RuntimeError(f"{mode} failed:\n{stderr.decode(errors='replace')}")
+
+        requests_after = server.request_counts()
+        requests = {k: v - requests_before.get(k, 0) for k, v in requests_after.items()
+                    if v != requests_before.get(k, 0)}
+        questions, product_ids = count_output(directory)
+
+    pages = sum(v for k, v in requests.items() if not k.endswith('-error'))
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+    return {
+        'mode': mode,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'pages': pages,
+        'requests': requests,
+        'questions': questions,
+        'product_ids': product_ids,
+        'pages_per_second': round(pages / wall, 2),
+        'questions_per_second': round(questions / wall, 2),
+    }
+
+
+def report(results, baseline=None):
+    baseline = {r['mode']: r for r in baseline or []}
+    columns = ('mode', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'pages', 'product_ids', 'questions',
+               'pages_per_second', 'questions_per_second')
+    print(" | ".join(f"{c:>20}" for c in columns))
+    for result in results:
+        print(" | ".join(f"{result[c]:>20}" for c in columns))
+
+        before = baseline.get(result['mode'])
+        if before:
+            changes = []
+            for c in ('wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'pages_per_second'):
+                if before[c]:
+                    changes.append(f"{c} {(result[c] - before[c]) / before[c]:+.1%}")
+            print(f"{'vs baseline':>20} | " + ", ".join(changes))
+
+
+def best_of(runs):
+    """
+    :return:
+    the run with the shortest wall time, the least disturbed by the rest of the machine
+    """
+    return min(runs, key=lambda r: r['wall_seconds'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmark of the scrapper against a local replay server")
+    parser.add_argument("--modes", nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument("--main-args", default="", help="Extra arguments for main.py, e.g. --main-args='--async'")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each mode, the fastest one is reported")
+    parser.add_argument("-g", "--max-pages", type=int, default=-1)
+    parser.add_argument("-p", "--max-products", type=int, default=-1)
+    parser.add_argument("-q", "--max-questions", type=int, default=-1)
+    parser.add_argument("-a", "--max-answers", type=int, default=-1)
+    parser.add_argument("--save", metavar="RESULTS_FILENAME", help="Saves the results as JSON")
+    parser.add_argument("--compare", metavar="RESULTS_FILENAME", help="Compares with results saved before")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    replay_server = server_from_args(args).start()
+    try:
+        results = [best_of([run_mode(mode, replay_server, args) for _ in range(args.repeat)])
+                   for mode in args.modes]
+    finally:
+        replay_server.stop()
+
+    baseline_results = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline_results = json.load(f)['results']
+
+    report(results, baseline_results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
@@ -0,0 +1,223 @@
+"""
+Local stand-in for the website, serving the HTML fixtures with configurable latency, errors and pagination depth.
+
+    python bench/server.py --port 8000 --latency 0.05 --error-rate 0.02
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from string import Template
+from urllib.parse import parse_qs, quote_plus, urlsplit
+
+import argparse
+import html
+import random
+import re
+import threading
+import time
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+
+def fixture(name: str):
+    return Template((FIXTURES / f"{name}.html").read_text(encoding="utf-8"))
+
+
+class Catalog:
+    """
+    The pages of the fake website: results pages listing products, and the questions and answers of each product
+    """
+
+    def __init__(self, results_pages=3, products_per_page=16, questions_pages=3, questions_per_page=10,
+                 answers_pages=2, answers_per_page=10, product_size_kb=500):
+        self.results_pages = results_pages
+        self.products_per_page = products_per_page
+        self.questions_pages = questions_pages
+        self.questions_per_page = questions_per_page
+        self.answers_pages = answers_pages
+        self.answers_per_page = answers_per_page
+
+        self.templates = {name: fixture(name) for name in ('results', 'result_card', 'product', 'questions',
+                                                          'question_card', 'answers', 'answer_card')}
+        filler = (FIXTURES / 'product_filler.html').read_text(encoding="utf-8")
+        self.product_filler = filler * max(1, product_size_kb * 1024 // len(filler))
+
+    @staticmethod
+    def product_id(page: int, index: int):
+        return f"B{page:03}{index:05}X"
+
+    def product_ids(self):
+        return [self.product_id(page, index)
+                for page in range(1, self.results_pages + 1) for index in range(self.products_per_page)]
+
+    @staticmethod
+    def next_link(page: int, last_page: int, href: str):
+        if page < last_page:
+            return f'<li class="a-last"><a href="{href}{page + 1}">Next<span class="a-letter-space"></span></a></li>'
+        return '<li class="a-disabled a-last">Next<span class="a-letter-space"></span></li>'
+
+    def results(self, language: str, keyword: str, page: int):
+        cards = "\n".join(self.templates['result_card'].substitute(
+            product_id=self.product_id(page, i), index=i, language=language, keyword=quote_plus(keyword))
+                          for i in range(self.products_per_page))
+
+        if page < self.results_pages:
+            next_link = (f'<a class="s-pagination-item s-pagination-next s-pagination-button"'
+                         f' href="/s?k={quote_plus(keyword)}&amp;page={page + 1}">Next</a>')
+        else:
+            next_link = '<span class="s-pagination-item s-pagination-next s-pagination-disabled">Next</span>'
+
+        return self.templates['results'].substitute(language=language, keyword=html.escape(keyword), cards=cards,
+                                                    page=page, next=next_link)
+
+    def product(self, language: str, product_id: str):
+        return self.templates['product'].substitute(language=language, product_id=product_id,
+                                                    ratings_count=len(product_id) * 97, filler=self.product_filler)
+
+    def questions(self, language: str, product_id: str, page: int):
+        cards = "\n".join(self.templates['question_card'].substitute(
+            language=language, product_id=product_id, question_id=f"{product_id}Q{page:03}{i:03}", votes=i,
+            answer_count=self.answers_pages * self.answers_per_page)
+                          for i in range(self.questions_per_page))
+
+        next_link = self.next_link(page, self.questions_pages,
+                                   f"/-/{language}/ask/questions/asin/{product_id}/ref=ask_ql_psf_ql_hza"
+                                   f"?isAnswered=true&amp;pageNumber=")
+        return self.templates['questions'].substitute(language=language, product_id=product_id,
+                                                      ratings_count=len(product_id) * 97, cards=cards,
+                                                      page=page, next=next_link)
+
+    def answers(self, language: str, question_id: str, page: int):
+        cards = "\n".join(self.templates['answer_card'].substitute(
+            answer_id=f"{question_id}A{page:03}{i:03}", author=f"Customer {i}",
+            answer_date=f"{MONTHS[i % 12]} {i % 28 + 1}, {2015 + i % 8}",
+            badge='<span class="askNewAuthorBadge">Seller</span>' if i == 0 else "",
+            upvotes=i, allvotes=2 * i + 1)
+                          for i in range(self.answers_per_page))
+
+        next_link = self.next_link(page, self.answers_pages,
+                                   f"/-/{language}/ask/answers/{question_id}/ref=ask_al_psf_al_hza?pageNumber=")
+        return self.templates['answers'].substitute(language=language, question_id=question_id,
+                                                    question_date="January 5, 2020", cards=cards,
+                                                    page=page, next=next_link)
+
+    def page(self, path: str, query: dict):
+        """
+        :return:
+        the page type and HTML for the path, or (None, None) if there is no such page
+        """
+        page = int(query.get('page', query.get('pageNumber', ['1']))[0])
+
+        if path == '/s':
+            return 'results', self.results('en', query.get('k', [''])[0], page)
+        if match := re.match(r"/-/(\w+)/(?:[^/]+/)?dp/(\w+)/", path):
+            return 'product', self.product(match.group(1), match.group(2))
+        if match := re.match(r"/-/(\w+)/ask/questions/asin/(\w+)/", path):
+            return 'questions', self.questions(match.group(1), match.group(2), page)
+        if match := re.match(r"/-/(\w+)/ask/answers/(\w+)/", path):
+            return 'answers', self.answers(match.group(1), match.group(2), page)
+        return None, None
+
+
+class ReplayServer:
+    """
+    Serves the catalog pages over HTTP in a background thread,
+    waiting latency plus up to jitter seconds per request, and answering 503 to a share of them
+    """
+
+    def __init__(self, catalog: Catalog, port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                page_type, content = server.catalog.page(url.path, parse_qs(url.query))
+                with server.lock:
+                    delay = server.latency + server.random.uniform(0, server.jitter)
+                    failed = server.random.random() < server.error_rate
+                    key = f"{page_type}-error" if failed else page_type
+                    server.requests[key] = server.requests.get(key, 0) + 1
+                time.sleep(delay)
+
+                if content is None:
+                    status, body = 404, b"Not found"
+                elif failed:
+                    status, body = 503, b"Service unavailable"
+                else:
+                    status, body = 200, content.encode()
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+
+    def request_counts(self):
+        with self.lock:
+            return dict(self.requests)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="replay-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds waited before every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the latency jitter and the errors")
+    parser.add_argument("--results-pages", type=int, default=3)
+    parser.add_argument("--products-per-page", type=int, default=16)
+    parser.add_argument("--questions-pages", type=int, default=3)
+    parser.add_argument("--questions-per-page", type=int, default=10)
+    parser.add_argument("--answers-pages", type=int, default=2)
+    parser.add_argument("--answers-per-page", type=int, default=10)
+    parser.add_argument("--product-size-kb", type=int, default=500, help="Approximate size of the product pages")
+
+
+def server_from_args(args, port=0):
+    catalog = Catalog(args.results_pages, args.products_per_page, args.questions_pages, args.questions_per_page,
+                      args.answers_pages, args.answers_per_page, args.product_size_kb)
+    return ReplayServer(catalog, port, args.latency, args.jitter, args.error_rate, args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the website, serving the HTML fixtures")
+    parser.add_argument("--port", type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    replay_server = server_from_args(args, args.port)
+    print(f"Serving on {replay_server.url}, Ctrl+C to stop")
+    try:
+        replay_server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        replay_server.stop()
@@ -0,0 +1,88 @@
+"""
+Sharded crawl check: runs several main.py processes at once on one box, each one with its own --shard,
+against the local replay server, merges their outputs with shard.py, and checks that the shards fetched disjoint
+products and that the merged dataset is the same as the one of a single process.
+Run it from the project root:
+
+    python bench/shards.py
+    python bench/shards.py --shards 4 --mode sequential
+"""
+from pathlib import Path
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from run import ROOT, write_config
+from server import add_arguments, server_from_args
+from writer import read_records
+
+
+def crawl(server, args, shards=1):
+    """
+    Runs main.py in a new directory, in as many processes as shards, and merges their outputs
+    :return:
+    the merged questions by (product id, question id), the product pages requested, and the wall time
+    """
+    with tempfile.TemporaryDirectory(prefix=f"bench-shards-{shards}-") as directory:
+        directory = Path(directory)
+        write_config(directory, server)
+
+        command = [sys.executable, str(ROOT / 'main.py'), '-g', '-1', '-p', '-1',
+                   '-q', str(args.max_questions), '-a', str(args.max_answers)]
+        if args.mode == 'scrap-prod-ids':
+            (directory / 'products.txt').write_text("\n".join(server.catalog.product_ids()) + "\n")
+            command += ['--scrap-prod-ids', 'products.txt']
+
+        products_before = server.request_counts().get('product', 0)
+        start = time.perf_counter()
+        processes = [subprocess.Popen(command + (['--shard', f"{i}/{shards}"] if shards > 1 else []), cwd=directory,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                     for i in range(1, shards + 1)]
+        for process in processes:
+            _, stderr = process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"main.py failed:\n{stderr.decode(errors='replace')}")
+        wall = time.perf_counter() - start
+        product_requests = server.request_counts().get('product', 0) - products_before
+
+        # merged in the crawl directory, so that the merge log is written there too
+        subprocess.run([sys.executable, str(ROOT / 'shard.py'), 'merged', '.'], cwd=directory, check=True,
+                       stdout=subprocess.DEVNULL)
+        questions = {(q['product_id'], q['id']): q for q in read_records(str(directory / 'merged.jsonl'))}
+
+    return questions, product_requests, wall
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Checks that a crawl split in shards merges into the same dataset")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--mode", choices=['scrap-prod-ids', 'sequential'], default='scrap-prod-ids')
+    parser.add_argument("-q", "--max-questions", type=int, default=5)
+    parser.add_argument("-a", "--max-answers", type=int, default=5)
+    add_arguments(parser)
+    parser.set_defaults(results_pages=2, questions_pages=1, answers_pages=1, product_size_kb=50)
+    args = parser.parse_args()
+
+    replay_server = server_from_args(args).start()
+    try:
+        single, single_requests, single_wall = crawl(replay_server, args)
+        sharded, sharded_requests, sharded_wall = crawl(replay_server, args, args.shards)
+    finally:
+        replay_server.stop()
+
+    print(f"1 process: {len(single)} questions, {single_requests} product pages, {single_wall:.2f}s")
+    print(f"{args.shards} shards: {len(sharded)} questions, {sharded_requests} product pages, {sharded_wall:.2f}s")
+
+    disjoint = sharded_requests == single_requests
+    same = (sorted(single) == sorted(sharded)
+            and all(json.dumps(single[key]) == json.dumps(sharded[key]) for key in single))
+    print(f"Shards fetched disjoint products: {'OK' if disjoint else 'FAILED'}")
+    print(f"Merged dataset same as a single process: {'OK' if same else 'FAILED'}")
+
+    sys.exit(0 if disjoint and same else 1)
@@ -0,0 +1,89 @@
+"""
+Startup budget check: runs main.py with -X importtime against the local replay server,
+and fails if the imports take longer than the budget, or if modules that the mode does not need are imported.
+Run it from the project root:
+
+    python bench/startup.py
+    python bench/startup.py --budget-ms 150 --mode scrap-prod-ids
+"""
+from pathlib import Path
+
+import argparse
+import re
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, str(Path(__file__).parent))
+from run import ROOT, write_config
+from server import Catalog, ReplayServer
+
+# modules that must not be imported by each mode
+NOT_NEEDED = {
+    'save-prod-ids': ['asyncio', 'dateparser', 'jobstore', 'incremental', 'pipeline', 'multiprocessing', 'cProfile'],
+    'scrap-prod-ids': ['asyncio', 'incremental', 'pipeline', 'multiprocessing', 'cProfile'],
+    'sequential': ['asyncio', 'jobstore', 'incremental', 'pipeline', 'multiprocessing', 'cProfile'],
+}
+
+IMPORT_LINE = re.compile(r"import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent>\s*)(?P<module>\S+)")
+
+
+def imports(mode: str, server):
+    """
+    Runs main.py in the mode, scrapping one product with one question and answer
+    :return:
+    {module: cumulative import microseconds} for the top level imports of the run
+    """
+    with tempfile.TemporaryDirectory(prefix=f"startup-{mode}-") as directory:
+        directory = Path(directory)
+        write_config(directory, server)
+
+        command = [sys.executable, '-X', 'importtime', str(ROOT / 'main.py'), '-g', '1', '-p', '1', '-q', '1', '-a', '1']
+        if mode == 'save-prod-ids':
+            command.append('--save-prod-ids')
+        elif mode == 'scrap-prod-ids':
+            (directory / 'products.txt').write_text(server.catalog.product_ids()[0] + "\n")
+            command += ['--scrap-prod-ids', 'products.txt']
+
+        run = subprocess.run(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                             check=True)
+
+    top_level = {}
+    for match in IMPORT_LINE.finditer(run.stderr):
+        if not match['indent']:
+            top_level[match['module']] = int(match['cumulative'])
+    return top_level
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Checks the import time of main.py against a budget")
+    parser.add_argument("--mode", nargs='+', dest="modes", choices=list(NOT_NEEDED), default=list(NOT_NEEDED))
+    parser.add_argument("--budget-ms", type=float, default=250, help="Max milliseconds spent importing modules")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each mode, the fastest one is checked")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    args = parser.parse_args()
+
+    replay_server = ReplayServer(Catalog(results_pages=1, products_per_page=1, questions_pages=1,
+                                         questions_per_page=1, answers_pages=1, answers_per_page=1)).start()
+    failed = False
+    try:
+        for mode in args.modes:
+            runs = [imports(mode, replay_server) for _ in range(args.repeat)]
+            fastest = min(runs, key=lambda r: sum(r.values()))
+            total_ms = sum(fastest.values()) / 1000
+            # a module imported in any of the runs was not needed
+            not_needed = sorted({m for r in runs for m in r if m.split('.')[0] in NOT_NEEDED[mode]})
+
+            within_budget = total_ms <= args.budget_ms
+            print(f"{mode}: {total_ms:.1f} ms importing modules, budget {args.budget_ms:.0f} ms"
+                  f" {'OK' if within_budget else 'EXCEEDED'}")
+            for module, microseconds in sorted(fastest.items(), key=lambda m: -m[1])[:args.top]:
+                print(f"  {microseconds / 1000:8.1f} ms  {module}")
+            if not_needed:
+                print(f"  imported without being needed: {', '.join(not_needed)}")
+
+            failed = failed or not within_budget or bool(not_needed)
+    finally:
+        replay_server.stop()
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,133 @@
+from collections import namedtuple
+
+import sqlite3
+import threading
+import time
+
+from config import config
+from log import Logger
+
+CachedResponse = namedtuple('CachedResponse', ['content', 'etag', 'last_modified', 'stored_at'])
+
+
+class ResponseCache:
+    """
+    Responses stored on disk, keyed on url and Accept-Language.
+    When the cache grows over its max size, the least recently used responses are evicted
+    """
+
+    def __init__(self, path="cache.sqlite", max_size=500 * 1024 * 1024):
+        """
+        :param path:
+        database file where responses are stored
+        :param max_size:
+        max number of bytes of content stored
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                        " url TEXT, language TEXT, content BLOB, etag TEXT, last_modified TEXT,"
+                        " stored_at REAL, accessed_at REAL, size INTEGER,"
+                        " PRIMARY KEY (url, language))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def from_config():
+        """
+        :return:
+        a new ResponseCache with the settings from the config file, or None if the cache is disabled
+        """
+        settings = config['cache']
+        if not settings['enabled']:
+            return None
+        return ResponseCache(settings['path'], settings['max-size-mb'] * 1024 * 1024)
+
+    @staticmethod
+    def ttl(page_type: str) -> float:
+        """
+        :return:
+        seconds a response for the page type is fresh, before it needs to be revalidated
+        """
+        return config['cache']['ttl'].get(page_type, 0)
+
+    def get(self, url: str, language: str):
+        """
+        :return:
+        the CachedResponse for the url and language, or None if there is none
+        """
+        with self.lock:
+            row = self.db.execute("SELECT content, etag, last_modified, stored_at FROM responses"
+                                  " WHERE url = ? AND language = ?", (url, language)).fetchone()
+            if row is None:
+                return None
+
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE url = ? AND language = ?",
+                            (time.time(), url, language))
+            self.db.commit()
+
+        return CachedResponse(*row)
+
+    def store(self, url: str, language: str, response):
+        """
+        Stores the content of the response with its validators, evicting old responses if needed
+        """
+        now = time.time()
+        content = response.content
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE url = ? AND language = ?",
+                                  (url, language)).fetchone()
+            self.size += len(content) - (old[0] if old else 0)
+
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (url, language, content,
+                             response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                             now, now, len(content)))
+            self._evict()
+            self.db.commit()
+
+    def refresh(self, url: str, language: str):
+        """
+        Marks the stored response as fresh again, after the server confirmed it did not change
+        """
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored_at = ? WHERE url = ? AND language = ?",
+                            (time.time(), url, language))
+            self.db.commit()
+
+    def delete(self, url: str, language: str):
+        """
+        Removes the stored response, e.g. a page whose content was not usable, so that it is requested again
+        """
+        with self.lock:
+            row = self.db.execute("SELECT size FROM responses WHERE url = ? AND language = ?",
+                                  (url, language)).fetchone()
+            if row is None:
+                return
+            self.db.execute("DELETE FROM responses WHERE url = ? AND language = ?", (url, language))
+            self.db.commit()
+            self.size -= row[0]
+
+    def _evict(self):
+        while self.size > self.max_size:
+            rows = self.db.execute("SELECT url, language, size FROM responses"
+                                   " ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                self.size = 0
+                return
+
+            for url, language, size in rows:
+                self.db.execute("DELETE FROM responses WHERE url = ? AND language = ?", (url, language))
+                self.size -= size
+                if self.size <= self.max_size:
+                    return
+
+    def report(self):
+        Logger.log(f"Cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} misses"
+                   f", {self.size / 1024 / 1024:.1f} MB stored")
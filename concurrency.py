@@ -0,0 +1,41 @@
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import asyncio
+
+from config import config
+
+
+class FetchLimits:
+    """
+    Bounds the number of requests in flight in async mode,
+    both globally and for each host
+    """
+
+    def __init__(self, global_limit: int, per_host_limit: int):
+        self.global_limit = global_limit
+        self.per_host_limit = per_host_limit
+        self._global = None
+        self._hosts = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        """
+        Waits until a request to the host can be made without exceeding the limits
+        """
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.global_limit)
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host_limit)
+
+        async with self._global, self._hosts[host]:
+            yield
+
+
+@lru_cache
+def fetch_limits():
+    """
+    :return:
+    the fetch limits shared by every page, with the settings from the config file
+    """
+    return FetchLimits(config['concurrency']['global'], config['concurrency']['per-host'])
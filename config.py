@@ -1,12 +1,43 @@
-import yaml
+class __Config:
+    """
+    Settings from the config file, read once: explicitly with load(), or from config.yml on first use
+    """
 
+    def __init__(self):
+        self._values = None
 
-class __Config:
+    def load(self, path='config.yml'):
+        # yaml is imported here, so that importing the modules does not read nor parse anything
+        import yaml
+
+        with open(path, 'r') as f:
+            self._values = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+        return self
+
+    def set_values(self, values: dict):
+        """
+        Takes the settings already read, e.g. by the process that started this one
+        """
+        self._values = values
+        return self
 
     @property
-    def config(self) -> dict:
-        with open('config.yml', 'r') as f:
-            return yaml.safe_load(f)
+    def values(self) -> dict:
+        if self._values is None:
+            self.load()
+        return self._values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
 
 
-config = __Config().config
+config = __Config()
@@ -0,0 +1,96 @@
+from datetime import datetime
+from functools import lru_cache
+
+import re
+
+from config import config
+
+MONTHS = {
+    'en': ["january", "february", "march", "april", "may", "june",
+           "july", "august", "september", "october", "november", "december"],
+    'es': ["enero", "febrero", "marzo", "abril", "mayo", "junio",
+           "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"],
+    'pt': ["janeiro", "fevereiro", "março", "abril", "maio", "junho",
+           "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"],
+    'fr': ["janvier", "février", "mars", "avril", "mai", "juin",
+           "juillet", "août", "septembre", "octobre", "novembre", "décembre"],
+    'it': ["gennaio", "febbraio", "marzo", "aprile", "maggio", "giugno",
+           "luglio", "agosto", "settembre", "ottobre", "novembre", "dicembre"],
+    'de': ["januar", "februar", "märz", "april", "mai", "juni",
+           "juli", "august", "september", "oktober", "november", "dezember"],
+}
+
+# Date formats used by the site for each language, e.g. "March 3, 2021", "3 de marzo de 2021", "3. März 2021"
+FORMATS = {
+    'en': [r"(?P<month>[^\W\d_]+)\.? (?P<day>\d{1,2}), (?P<year>\d{4})",
+           r"(?P<day>\d{1,2}) (?P<month>[^\W\d_]+)\.? (?P<year>\d{4})"],
+    'es': [r"(?P<day>\d{1,2}) de (?P<month>[^\W\d_]+)\.? de (?P<year>\d{4})"],
+    'pt': [r"(?P<day>\d{1,2}) de (?P<month>[^\W\d_]+)\.? de (?P<year>\d{4})"],
+    'fr': [r"(?P<day>\d{1,2})(?:er)? (?P<month>[^\W\d_]+)\.? (?P<year>\d{4})"],
+    'it': [r"(?P<day>\d{1,2}) (?P<month>[^\W\d_]+)\.? (?P<year>\d{4})"],
+    'de': [r"(?P<day>\d{1,2})\. (?P<month>[^\W\d_]+)\.? (?P<year>\d{4})"],
+}
+
+
+def month_numbers(months):
+    """
+    :return:
+    month number for each month name and for each unambiguous abbreviation of 3 or more letters
+    """
+    numbers = {}
+    for i, name in enumerate(months, 1):
+        for length in range(3, len(name) + 1):
+            prefix = name[:length]
+            if sum(m.startswith(prefix) for m in months) == 1 or prefix == name:
+                numbers[prefix] = i
+    return numbers
+
+
+MONTH_NUMBERS = {language: month_numbers(months) for language, months in MONTHS.items()}
+PATTERNS = {language: [re.compile(f, re.IGNORECASE) for f in formats] for language, formats in FORMATS.items()}
+
+
+def fast_date(text: str, language: str):
+    """
+    :return:
+    the first date in the text written in one of the known formats of the language, or None if there is none
+    """
+    language = language.split('-')[0].lower()
+    months = MONTH_NUMBERS.get(language, {})
+    for pattern in PATTERNS.get(language, []):
+        for match in pattern.finditer(text):
+            month = months.get(match['month'].lower())
+            if month is None:
+                continue
+            try:
+                return datetime(int(match['year']), month, int(match['day']))
+            except ValueError:
+                continue
+    return None
+
+
+def find_date(text: str, language: str):
+    """
+    :return:
+    the first date in the text, or None if there is none.
+    Known formats are parsed directly, any other text is searched by dateparser.
+    Results are remembered for the last date-cache-size texts
+    """
+    return cached_find_date()(text, language)
+
+
+@lru_cache
+def cached_find_date():
+    # the cache size comes from the config file, that is read on first use instead of on import
+    return lru_cache(maxsize=config['date-cache-size'])(uncached_find_date)
+
+
+def uncached_find_date(text: str, language: str):
+    date = fast_date(text, language)
+    if date is not None:
+        return date
+
+    from dateparser.search import search_dates
+
+    found = search_dates(text, languages=[language])
+    return found[0][1] if found else None
@@ -0,0 +1,160 @@
+from bs4 import Tag
+
+import re
+
+# parts of a compound selector: tag name, #id, .class, and [attribute], [attribute=value], [attribute^=value], ...
+COMPOUND_PART = re.compile(r"""
+    (?P<name>^[a-zA-Z][\w-]*)
+  | \#(?P<id>[\w-]+)
+  | \.(?P<class>[\w-]+)
+  | \[\s*(?P<attribute>[\w-]+)\s*(?:(?P<operator>[\^$*]?=)\s*(?:'(?P<single>[^']*)'|"(?P<double>[^"]*)"|(?P<bare>[\w-]+)))?\s*]
+""", re.VERBOSE)
+
+ATTRIBUTE_OPERATORS = {
+    None: lambda value, expected: True,
+    '=': lambda value, expected: value == expected,
+    '^=': lambda value, expected: value.startswith(expected),
+    '$=': lambda value, expected: value.endswith(expected),
+    '*=': lambda value, expected: expected in value,
+}
+
+
+class Compound:
+    """
+    A compound selector, e.g. div.a-section#id[data-id^='x'], matched against one tag
+    """
+
+    def __init__(self, text: str):
+        self.name = None
+        self.id = None
+        self.classes = set()
+        self.attributes = []
+
+        position = 0
+        while position < len(text):
+            match = COMPOUND_PART.match(text, position)
+            if not match or match.end() == position:
+                raise ValueError(f"Unsupported selector '{text}'")
+            position = match.end()
+
+            if match['name']:
+                self.name = match['name'].lower()
+            elif match['id']:
+                self.id = match['id']
+            elif match['class']:
+                self.classes.add(match['class'])
+            else:
+                expected = next((v for v in (match['single'], match['double'], match['bare']) if v is not None), None)
+                self.attributes.append((match['attribute'], ATTRIBUTE_OPERATORS[match['operator']], expected))
+
+    def match(self, tag: Tag):
+        if self.name and tag.name != self.name:
+            return False
+        if self.id and tag.get('id') != self.id:
+            return False
+        if self.classes and not self.classes.issubset(tag.get('class') or ()):
+            return False
+        for attribute, operator, expected in self.attributes:
+            value = tag.get(attribute)
+            if value is None:
+                return False
+            if isinstance(value, list):
+                value = " ".join(value)
+            if not operator(value, expected):
+                return False
+        return True
+
+
+class Selector:
+    """
+    A CSS selector made of compound selectors and descendant or child combinators, e.g. ".vote .count" or
+    ".a-spacing-small > span", compiled once to be matched against single tags
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        tokens = re.sub(r"\s*>\s*", " > ", text.strip()).split()
+
+        # (combinator with the compound on its right, compound), from right to left
+        self.parts = []
+        combinator = None
+        for token in reversed(tokens):
+            if token == '>':
+                combinator = '>'
+                continue
+            if self.parts and combinator is None:
+                combinator = ' '
+            self.parts.append((combinator, Compound(token)))
+            combinator = None
+
+        if not self.parts or combinator is not None:
+            raise ValueError(f"Unsupported selector '{text}'")
+
+    def match(self, tag: Tag):
+        return self.parts[0][1].match(tag) and self._match_ancestors(tag, 1)
+
+    def _match_ancestors(self, tag: Tag, index: int):
+        if index == len(self.parts):
+            return True
+
+        combinator, compound = self.parts[index]
+        if combinator == '>':
+            parent = tag.parent
+            return parent is not None and compound.match(parent) and self._match_ancestors(parent, index + 1)
+
+        return any(compound.match(ancestor) and self._match_ancestors(ancestor, index + 1)
+                   for ancestor in tag.parents)
+
+
+class Field:
+    """
+    A field of a card: the first tag in the card that matches the selector,
+    only among the descendants of another field of the card if within is set
+    """
+
+    def __init__(self, selector: str, within: str = None):
+        self.selector = Selector(selector)
+        self.within = within
+
+
+class CardFields:
+    """
+    The fields of the cards of a page, declared once per page class with their selectors.
+    All the fields of a card are found in a single walk over the card descendants, as select_one on each field would
+    """
+
+    def __init__(self, **fields):
+        """
+        :param fields:
+        name: selector, or name: Field
+        """
+        self.fields = [(name, field if isinstance(field, Field) else Field(field)) for name, field in fields.items()]
+
+    def extract(self, card: Tag):
+        """
+        :return:
+        {field name: first tag matching the field, or None}
+        """
+        found = dict.fromkeys(name for name, field in self.fields)
+        pending = list(self.fields)
+
+        for tag in card.descendants:
+            if not isinstance(tag, Tag):
+                continue
+
+            matched = False
+            for name, field in pending:
+                if field.within:
+                    scope = found[field.within]
+                    if scope is None or not any(parent is scope for parent in tag.parents):
+                        continue
+                if field.selector.match(tag):
+                    found[name] = tag
+                    matched = True
+
+            if matched:
+                pending = [(name, field) for name, field in pending if found[name] is None]
+                if not pending:
+                    break
+
+        return found
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import time
+
+from config import config
+from log import Logger
+from page import QuestionsPage, AnswersPage
+
+
+class SeenIndex:
+    """
+    Questions already scraped for each product, with their answer count, votes and answer ids,
+    so that a later crawl fetches only what is new or changed
+    """
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS questions ("
+                        " product_id TEXT, question_id TEXT, answer_count INTEGER, votes INTEGER, answer_ids TEXT,"
+                        " seen_at REAL, PRIMARY KEY (product_id, question_id))")
+        self.db.commit()
+
+    @staticmethod
+    def from_config():
+        return SeenIndex(config['incremental']['index-path'])
+
+    def product(self, product_id: str):
+        """
+        :return:
+        {question_id: (answer_count, votes, answer_ids)} for the questions seen for the product
+        """
+        rows = self.db.execute("SELECT question_id, answer_count, votes, answer_ids FROM questions"
+                               " WHERE product_id = ?", (product_id,))
+        return {question_id: (answer_count, votes, set(json.loads(answer_ids)))
+                for question_id, answer_count, votes, answer_ids in rows}
+
+    def record(self, product_id: str, question, answer_count, answer_ids):
+        """
+        Registers the question as seen. Changes are kept until commit(), so that a product that failed
+        is crawled again on the next run
+        """
+        self.db.execute("INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?)",
+                        (product_id, question.id, answer_count, question.votes,
+                         json.dumps(sorted(answer_ids)), time.time()))
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def changed_questions(self, questions_page: QuestionsPage, product_id: str, product=None,
+                          max_questions=-1, max_answers_per_question=-1, metadata='questions'):
+        """
+        Navigates the questions of the product, stopping after a page with no new or changed questions
+        :param product:
+        the product data to be added to each question. If None, it is taken from the questions page
+        as in QuestionsPage.product()
+        :return:
+        new questions, and questions whose answer count or votes changed, one by one.
+        Changed questions only hold their new answers
+        """
+        if max_questions == 0:
+            return
+
+        known = self.product(product_id)
+        question_count = 0
+        changed_cards = {}
+
+        def changed(page):
+            # (question, answers page, listed answer count, seen) of the new and changed questions of the page
+            if page.parameters not in changed_cards:
+                cards = []
+                for question, answers_page in page.question_cards():
+                    answer_count = answers_page.listed_answer_count
+                    seen = known.get(question.id)
+                    if seen is None or seen[1] != question.votes or answer_count not in (None, seen[0]):
+                        cards.append((question, answers_page, answer_count, seen))
+                changed_cards[page.parameters] = cards
+            return changed_cards[page.parameters]
+
+        def pages_needed(page):
+            # the crawl stops at a page with no changes, or at the one completing max questions
+            cards = changed(page)
+            return 0 if not cards or 0 <= max_questions <= question_count + len(cards) else None
+
+        for page in questions_page.pages(pages_needed):
+            cards = changed(page)
+            del changed_cards[page.parameters]
+
+            for question, answers_page, answer_count, seen in cards:
+                seen_answer_count, _, seen_answer_ids = seen if seen is not None else (None, None, set())
+                if product is None:
+                    product = page.product(product_id, metadata)
+
+                # the date comes first: the answers pages are released while navigating them
+                question.date = answers_page.question_date()
+                question.answers = self.new_answers(answers_page, seen_answer_ids, max_answers_per_question)
+                question.product = product
+
+                answer_ids = seen_answer_ids | {a.id for a in question.answers}
+                capped = len(question.answers) == max_answers_per_question
+                if answer_count is not None and len(answer_ids) < answer_count and not capped:
+                    # some answers listed were not found: the question stays changed for the next crawl
+                    answer_count = seen_answer_count
+                self.record(product_id, question, answer_count, answer_ids)
+                yield question
+
+                question_count += 1
+                if question_count == max_questions:
+                    Logger.debug(f"Already collected max number of questions: {max_questions}")
+                    return
+
+            if not cards:
+                Logger.debug(f"No new questions in {page.url}, stopping")
+                return
+
+    @staticmethod
+    def new_answers(answers_page: AnswersPage, seen_answer_ids, max_answers=-1):
+        """
+        Navigates the answers pages of the question until all the answers listed in its question card are known,
+        or, if the question card has no answer count, up to the first page with no new answers
+        :return:
+        the answers not seen before
+        """
+        answers = []
+        known_ids = set(seen_answer_ids)
+        listed_count = answers_page.listed_answer_count
+        new_page_answers = {}
+
+        def page_answers(page):
+            # answers of the page not seen before, up to max answers
+            if page.parameters not in new_page_answers:
+                new = [a for a in page.items() if a.id not in known_ids]
+                new_page_answers[page.parameters] = new[:max_answers - len(answers)] if max_answers >= 0 else new
+            return new_page_answers[page.parameters]
+
+        def last_page(page):
+            new = page_answers(page)
+            if len(answers) + len(new) == max_answers:
+                return True
+            if listed_count is not None:
+                return len(known_ids) + len(new) >= listed_count
+            return bool(seen_answer_ids) and not new
+
+        if max_answers == 0:
+            return answers
+
+        for page in answers_page.pages(lambda page: 0 if last_page(page) else None):
+            last = last_page(page)
+            new = new_page_answers.pop(page.parameters)
+            answers += new
+            known_ids.update(a.id for a in new)
+            if last:
+                break
+
+        return answers
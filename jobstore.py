@@ -0,0 +1,285 @@
+from contextlib import contextmanager
+from pathlib import Path
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from config import config
+from log import Logger
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+# facts of each product known from previous crawls, where an unfinished product continues,
+# and its priority computed from the facts
+PRODUCT_COLUMNS = {'ratings_count': 'INTEGER', 'question_count': 'INTEGER', 'crawled_at': 'REAL', 'cursor': 'TEXT',
+                   'retry_at': 'REAL', 'priority': 'REAL'}
+
+# priority of a product with the weights as parameters. The days since it was crawled are counted from the epoch
+# backwards: the time of the lease adds the same to every product, so the order is the same without it
+PRIORITY = ("? * COALESCE(ratings_count, 0) - ? * COALESCE(crawled_at, 0) / 86400"
+            " + ? * COALESCE(question_count, 0)")
+
+
+class JobStore:
+    """
+    Product ids to be scraped and their state, stored in a database shared by several worker processes.
+    A worker leases a product before scraping it, so that no other worker takes it,
+    and then marks it as done or failed. Leases of crashed workers expire, returning the products to the queue
+    """
+
+    def __init__(self, path: str, lease_seconds=3600, max_attempts=3, retry_backoff=60, retry_backoff_max=1800):
+        """
+        :param path:
+        database file for the jobs
+        :param lease_seconds:
+        seconds a leased product is kept from other workers
+        :param max_attempts:
+        times a failing product is tried before leaving it failed
+        :param retry_backoff:
+        seconds a failed product waits before it can be leased again, doubled on each failed attempt
+        :param retry_backoff_max:
+        max seconds a failed product waits
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.RLock()
+
+        # autocommit mode: transactions are opened explicitly, taking the write lock from the start
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                        " product_id TEXT PRIMARY KEY, position INTEGER, state TEXT, attempts INTEGER,"
+                        " last_error TEXT, leased_by TEXT, leased_until REAL, updated_at REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_state_position ON jobs (state, position)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+
+        # job stores created by previous versions lack the product columns
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in PRODUCT_COLUMNS.items():
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+        # weights of the priority of the products: (ratings count, days since crawled, question count)
+        self.priority_weights = (0, 0, 0)
+        # weights the priority column was computed with, kept up to date by complete()
+        row = self.db.execute("SELECT value FROM settings WHERE name = 'priority-weights'").fetchone()
+        self.stored_weights = tuple(json.loads(row[0])) if row else None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the block in a transaction that takes the write lock from the start
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    @staticmethod
+    def from_config(product_ids_file: str):
+        """
+        :return:
+        the JobStore for the product ids file, with the settings from the config file
+        """
+        settings = config['job-store']
+        return JobStore(f"{product_ids_file}.jobs.sqlite", settings['lease-seconds'], settings['max-attempts'],
+                        settings['retry-backoff'], settings['retry-backoff-max'])
+
+    def add(self, product_ids):
+        """
+        Adds the product ids as pending, keeping their order. Ids already in the store are left as they are
+        """
+        now = time.time()
+        with self.transaction():
+            position = self.db.execute("SELECT COALESCE(MAX(position), 0) FROM jobs").fetchone()[0]
+            # nothing is known of a new product: its priority is 0 whatever the weights
+            self.db.executemany("INSERT OR IGNORE INTO jobs (product_id, position, state, attempts, updated_at,"
+                                " priority) VALUES (?, ?, ?, 0, ?, 0)",
+                                ((pid, position + i, PENDING, now) for i, pid in enumerate(product_ids, 1)))
+
+    def add_file(self, filename: str, keep=None):
+        """
+        Adds the product ids from the file, one per line
+        :param keep:
+        if set, only the product ids for which it returns True are added, e.g. the ones of a shard
+        """
+        with open(filename, 'r') as f:
+            self.add(pid for pid in f.read().split('\n') if pid and (keep is None or keep(pid)))
+
+    def import_saved_ids(self, saved_ids_file: str):
+        """
+        Marks as done the products registered as saved by previous versions of the scrapper
+        """
+        if not Path(saved_ids_file).exists():
+            return
+
+        with open(saved_ids_file, 'r') as f:
+            saved_ids = [(DONE, time.time(), pid) for pid in f.read().split('\n') if pid]
+
+        with self.transaction():
+            self.db.executemany("UPDATE jobs SET state = ?, updated_at = ? WHERE product_id = ?", saved_ids)
+
+    def set_priority(self, ratings_count=0, days_since_crawl=0, question_count=0):
+        """
+        Products are leased by priority, highest first, and then in file order. The priority is the sum of
+        what is known of the product from previous crawls times its weight. Never crawled products count
+        as crawled long ago, and facts not known count as 0. With every weight 0, products are leased in file order.
+        The priority is kept in an indexed column, computed again for every product only when the weights change
+        """
+        self.priority_weights = (ratings_count, days_since_crawl, question_count)
+        if not any(self.priority_weights):
+            return
+
+        with self.transaction():
+            self.db.execute("CREATE INDEX IF NOT EXISTS jobs_state_priority ON jobs (state, priority DESC, position)")
+            if self.stored_weights != self.priority_weights:
+                self.db.execute(f"UPDATE jobs SET priority = {PRIORITY}", self.priority_weights)
+                self.db.execute("INSERT OR REPLACE INTO settings VALUES ('priority-weights', ?)",
+                                (json.dumps(self.priority_weights),))
+                self.stored_weights = self.priority_weights
+
+    def _order(self):
+        """
+        :return:
+        the ORDER BY clause leasing products by priority, or in file order when every weight is 0
+        """
+        if not any(self.priority_weights):
+            return "ORDER BY position"
+        return "ORDER BY priority DESC, position"
+
+    def requeue(self):
+        """
+        Sets the done and failed products as pending again, to scrap them once more, e.g. on a periodic refresh
+        """
+        with self.transaction():
+            self.db.execute("UPDATE jobs SET state = ?, attempts = 0, last_error = NULL, cursor = NULL,"
+                            " retry_at = NULL, updated_at = ? WHERE state IN (?, ?)",
+                            (PENDING, time.time(), DONE, FAILED))
+
+    def lease(self, count=1):
+        """
+        Takes pending products for this worker: first the never tried, then the ones whose lease expired,
+        and then the failed ones that have attempts left and waited their backoff
+        :return:
+        the product ids leased, empty if there is nothing left to do
+        """
+        now = time.time()
+        order = self._order()
+        with self.transaction():
+            product_ids = [row[0] for row in self.db.execute(
+                f"SELECT product_id FROM jobs WHERE state = ? {order} LIMIT ?", (PENDING, count))]
+
+            if len(product_ids) < count:
+                product_ids += [row[0] for row in self.db.execute(
+                    f"SELECT product_id FROM jobs WHERE state = ? AND leased_until < ? {order} LIMIT ?",
+                    (LEASED, now, count - len(product_ids)))]
+
+            if len(product_ids) < count:
+                product_ids += [row[0] for row in self.db.execute(
+                    f"SELECT product_id FROM jobs WHERE state = ? AND attempts < ? AND COALESCE(retry_at, 0) <= ?"
+                    f" {order} LIMIT ?",
+                    (FAILED, self.max_attempts, now, count - len(product_ids)))]
+
+            self.db.executemany("UPDATE jobs SET state = ?, attempts = attempts + 1, leased_by = ?, leased_until = ?,"
+                                " updated_at = ? WHERE product_id = ?",
+                                ((LEASED, self.worker, now + self.lease_seconds, now, pid) for pid in product_ids))
+
+        return product_ids
+
+    def complete(self, product_id: str, ratings_count=None, question_count=None):
+        """
+        Marks the product as done, keeping the facts provided for its priority in later crawls
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE jobs SET state = ?, last_error = NULL, leased_by = NULL, leased_until = NULL,"
+                            " cursor = NULL, crawled_at = ?, ratings_count = COALESCE(?, ratings_count),"
+                            " question_count = COALESCE(?, question_count), updated_at = ? WHERE product_id = ?",
+                            (DONE, now, ratings_count, question_count, now, product_id))
+            if self.stored_weights is not None:
+                # the facts changed: the priority too
+                self.db.execute(f"UPDATE jobs SET priority = {PRIORITY} WHERE product_id = ?",
+                                (*self.stored_weights, product_id))
+
+    def pause(self, product_id: str, cursor: dict):
+        """
+        Returns an unfinished product to the queue, behind the products pending, to be continued from the cursor
+        """
+        with self.transaction():
+            position = self.db.execute("SELECT COALESCE(MAX(position), 0) FROM jobs").fetchone()[0]
+            self.db.execute("UPDATE jobs SET state = ?, attempts = 0, last_error = NULL, leased_by = NULL,"
+                            " leased_until = NULL, cursor = ?, position = ?, updated_at = ? WHERE product_id = ?",
+                            (PENDING, json.dumps(cursor), position + 1, time.time(), product_id))
+
+    def release(self, product_id: str):
+        """
+        Returns a leased product to the queue in its place, as if it had not been leased
+        """
+        with self.lock:
+            self.db.execute("UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), leased_by = NULL,"
+                            " leased_until = NULL, updated_at = ? WHERE product_id = ?",
+                            (PENDING, time.time(), product_id))
+
+    def cursor(self, product_id: str):
+        """
+        :return:
+        where the product continues, as saved by pause(), or None if it starts from the beginning
+        """
+        with self.lock:
+            row = self.db.execute("SELECT cursor FROM jobs WHERE product_id = ?", (product_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def fail(self, product_id: str, error):
+        """
+        Marks the product as failed. If it has attempts left, it can be leased again after its backoff,
+        so that the other products go on meanwhile
+        """
+        now = time.time()
+        with self.transaction():
+            row = self.db.execute("SELECT attempts FROM jobs WHERE product_id = ?", (product_id,)).fetchone()
+            backoff = min(self.retry_backoff_max, self.retry_backoff * 2 ** (max(row[0] if row else 1, 1) - 1))
+            self.db.execute("UPDATE jobs SET state = ?, last_error = ?, leased_by = NULL, leased_until = NULL,"
+                            " retry_at = ?, updated_at = ? WHERE product_id = ?",
+                            (FAILED, str(error), now + backoff, now, product_id))
+
+    def next_retry(self):
+        """
+        :return:
+        seconds until the next failed product with attempts left can be leased, 0 if one already can,
+        or None if no failed product has attempts left
+        """
+        with self.lock:
+            retry_at = self.db.execute("SELECT MIN(COALESCE(retry_at, 0)) FROM jobs WHERE state = ? AND attempts < ?",
+                                       (FAILED, self.max_attempts)).fetchone()[0]
+        return None if retry_at is None else max(0.0, retry_at - time.time())
+
+    def counts(self):
+        """
+        :return:
+        number of products in each state
+        """
+        with self.lock:
+            return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def log_counts(self):
+        counts = self.counts()
+        Logger.log(f"Products in {self.path}: " + ", ".join(f"{counts.get(s, 0)} {s}"
+                                                            for s in (PENDING, LEASED, DONE, FAILED)))
+
+    def close(self):
+        self.db.close()
@@ -1,8 +1,32 @@
 from datetime import datetime
 from pathlib import Path
 
+import atexit
+import json
+import os
+import queue
+import threading
+
 from config import config
 
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+# worker processes, e.g. the parse processes of the pipeline, can exit without running the exit handlers:
+# they write every record right away instead of from a background thread
+worker_process = False
+
+
+def mark_worker_process():
+    """
+    Registers this process as a worker process. Forked processes are registered on their own
+    """
+    global worker_process
+    worker_process = True
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=mark_worker_process)
+
 
 def save_debug(content):
     if config['debug']:
@@ -18,12 +42,155 @@ def save_debug(content):
         Logger.log()
 
 
+class LogWriter:
+    """
+    Writes log records from a background thread, in batches, keeping the log file open.
+    The file is rotated when it goes over max_bytes, keeping up to backups old files (out.log.1, out.log.2, ...)
+    """
+
+    def __init__(self, filename: str, console=True, json_lines=False, max_bytes=0, backups=3, batch_size=256):
+        self.filename = filename
+        self.console = console
+        self.json_lines = json_lines
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.thread = None
+        self.file = None
+
+    def put(self, level: str, message: str):
+        if self.pid != os.getpid():
+            self._start()
+
+        if self.thread is None:
+            with self.lock:
+                self._write([(datetime.now(), level, message)])
+        else:
+            self.queue.put((datetime.now(), level, message))
+
+    def _start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.file = None
+            self.thread = None
+            if not worker_process:
+                self.queue = queue.SimpleQueue()
+                self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self.thread.start()
+            self.pid = os.getpid()
+
+    def _format(self, created, level, message):
+        if self.json_lines:
+            return json.dumps({'time': created.isoformat(timespec='milliseconds'), 'level': level,
+                               'pid': self.pid, 'message': message}, ensure_ascii=False)
+        return f"{created:%Y-%m-%d %H:%M:%S} {level.upper():<7} {message}" if message else ""
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [r for r in batch if isinstance(r, tuple)]
+            if records:
+                self._write(records)
+
+            for request in batch:
+                if isinstance(request, threading.Event):
+                    request.set()
+                elif request is None:
+                    if self.file:
+                        self.file.close()
+                    return
+
+    def _write(self, records):
+        if self.file is None:
+            self.file = open(self.filename, 'a', encoding="utf-8")
+
+        lines = [self._format(*r) for r in records if r[2] or not self.json_lines]
+        self.file.write("".join(line + "\n" for line in lines))
+        self.file.flush()
+
+        if self.console:
+            print("\n".join(r[2] for r in records), flush=True)
+
+        # only the main process rotates, worker processes just append
+        if self.max_bytes and self.thread and self.file.tell() > self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self.file.close()
+        self.file = None
+        for i in range(self.backups - 1, 0, -1):
+            if Path(f"{self.filename}.{i}").exists():
+                Path(f"{self.filename}.{i}").replace(f"{self.filename}.{i + 1}")
+        if self.backups:
+            Path(self.filename).replace(f"{self.filename}.1")
+        else:
+            Path(self.filename).unlink()
+
+    def flush(self, timeout=10):
+        """
+        Waits until the records logged so far are written
+        """
+        if self.pid == os.getpid() and self.thread:
+            written = threading.Event()
+            self.queue.put(written)
+            written.wait(timeout)
+
+    def close(self):
+        if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(10)
+
+
 class Logger:
-    filename = config['log-file']
+    level = None
+    writer = None
+
+    @staticmethod
+    def configure():
+        """
+        Sets the level and the writer from the config file, on the first record logged
+        """
+        settings = config['logging']
+        Logger.writer = LogWriter(config['log-file'],
+                                  console=settings['console'],
+                                  json_lines=settings['format'] == 'json',
+                                  max_bytes=int(settings['max-size-mb'] * 1024 * 1024),
+                                  backups=settings['backups'])
+        Logger.level = LEVELS[settings['level']]
+        atexit.register(Logger.writer.close)
+
+    @staticmethod
+    def log(*lines: str, level='info'):
+        if Logger.writer is None:
+            Logger.configure()
+        if LEVELS[level] < Logger.level:
+            return
+        Logger.writer.put(level, "".join([str(line) for line in lines]))
+
+    @staticmethod
+    def debug(*lines: str):
+        Logger.log(*lines, level='debug')
+
+    @staticmethod
+    def warning(*lines: str):
+        Logger.log(*lines, level='warning')
+
+    @staticmethod
+    def error(*lines: str):
+        Logger.log(*lines, level='error')
 
     @staticmethod
-    def log(*lines: str):
-        with open(Logger.filename, 'a', encoding="utf-8") as f:
-            str_lines = "".join([str(line) for line in lines])
-            f.write(str_lines + "\n")
-            print(str_lines)
+    def flush():
+        if Logger.writer:
+            Logger.writer.flush()
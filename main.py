@@ -1,19 +1,32 @@
+from functools import lru_cache
 from pathlib import Path
 
 import argparse
+import datetime
+import glob
 import json
 import re
 import traceback
 
 from config import config
 from log import Logger
-from page import ResultsPage, ProductPage
-from utils import nap
+from metrics import exporting_metrics, profiling
+from page import ResultsPage, ProductPage, QuestionsPage
+from records import to_json_value
+from transport import Transport
+from utils import nap, process_pool
+from writer import RecordWriter
+
+# asyncio, the job store, the incremental index and the pipeline are imported only in the modes that use them,
+# to keep the startup of short-lived workers fast
+
+# product id in the url of a product page
+PRODUCT_ID_PATTERN = re.compile(r"dp(?:/|(?:%2F))(.*?)(?:/|(?:%2F))")
 
 
 def savefile(lines, file_name: str, file_format="json", directory: str = ""):
     if file_format not in ('json', 'txt'):
-        Logger.log(f"Format {file_format} not yet available...")
+        Logger.warning(f"Format {file_format} not yet available...")
 
     file_name += f".{file_format}"
     file = str(Path(directory).joinpath(file_name))
@@ -23,110 +36,782 @@ def savefile(lines, file_name: str, file_format="json", directory: str = ""):
 
     with open(file_name, 'w', encoding="utf-8") as f:
         if file_format == 'json':
-            content = json.dumps(lines)
+            content = json.dumps(lines, default=to_json_value)
         else:
             content = "\n".join(lines) + "\n"
 
         f.write(content)
 
 
-def save_product_ids(base_name: str, result_page: ResultsPage, max_pag=-1, max_prod=-1):
+class JsonRecords:
+    """
+    Collects records in memory, saving them as a JSON array when closed
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+    def close(self, suffix=""):
+        savefile(self.records, f"{self.file_name}{suffix}", file_format='json')
+
+
+class DatabaseRecords:
+    """
+    Saves the records in the results database, besides the output file if any
+    """
+
+    def __init__(self, database, records=None):
+        self.database = database
+        self.records = records
+
+    def write(self, record):
+        if self.records is not None:
+            self.records.write(record)
+        self.database.write(record)
+
+    def close(self, suffix=""):
+        if self.records is not None:
+            self.records.close(suffix)
+        self.database.flush()
+
+
+@lru_cache
+def results_database():
+    """
+    :return:
+    the results database of this process, or None if it is disabled
+    """
+    from resultsdb import ResultsDatabase
+    return ResultsDatabase.from_config()
+
+
+def open_records(file_name: str):
+    """
+    :return:
+    a writer for the records of the file, in the output format set in the config file,
+    saving them in the results database too if it is enabled
+    """
+    settings = config['results-db']
+    records = None
+    if not settings['enabled'] or settings['files']:
+        if config['output']['format'] == 'jsonl':
+            records = RecordWriter.from_config(file_name)
+        else:
+            records = JsonRecords(file_name)
+
+    if settings['enabled']:
+        return DatabaseRecords(results_database(), records)
+    return records
+
+
+def product_id_of(product: ProductPage):
+    return PRODUCT_ID_PATTERN.search(product.parameters).group(1)
+
+
+def product_ids(result_page: ResultsPage, max_pag=-1, max_prod=-1):
+    """
+    sequential navigation of result pages
+    :return:
+    the product ids one by one
+    """
+    for product, page_count in result_page.items_to_end(max_prod):
+        if page_count > max_pag >= 0:
+            Logger.log(f"Maximum number of pages reached! ({max_pag})")
+            return
+
+        yield product_id_of(product)
+
+
+def save_product_ids(base_name: str, result_page: ResultsPage, max_pag=-1, max_prod=-1, shard=None):
     """
     Saves product ids from result pages.
     sequential navigation of result pages
+    :param shard:
+    if set, only the product ids of the shard are saved
     """
-    page_counter = 1
     suffix = ""
     prod_ids = []
     try:
-        for product, page_count in result_page.items_to_end(max_prod):
-            if page_counter > max_pages >= 0:
-                Logger.log(f"Maximum number of pages reached! ({max_pag})")
-                break
-
-            product_id = re.search(r"dp(?:/|(?:%2F))(.*?)(?:/|(?:%2F))", product.parameters).group(1)
-            prod_ids.append(product_id)
+        for product_id in product_ids(result_page, max_pag, max_prod):
+            if shard is None or shard.owns(product_id):
+                prod_ids.append(product_id)
 
     except Exception as e:
-        Logger.log("Exception while getting Product ids! ", e)
-        Logger.log(traceback.format_exc())
+        Logger.error("Exception while getting Product ids! ", e)
+        Logger.error(traceback.format_exc())
         suffix = "_error"
         Logger.log("Saving remains...")
 
     savefile(prod_ids, f"{base_name}{suffix}", file_format='txt', directory='out')
 
 
-def save_q_and_a_from_pids(base_url: str, headers, filename: str, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1):
+def open_jobs(filename: str, requeue=False, shard=None):
+    """
+    :param requeue:
+    if True, the products already done or failed are set as pending again
+    :param shard:
+    if set, only the products of the shard are added, to a job store of its own
+    :return:
+    the job store for the product ids file,
+    with the ids from the file and the ones registered as saved in saved_ids.txt by previous versions
+    """
+    from jobstore import JobStore
+
+    if shard is None:
+        jobs = JobStore.from_config(filename)
+        jobs.add_file(filename)
+    else:
+        jobs = JobStore.from_config(f"{filename}.{shard.name}")
+        jobs.add_file(filename, shard.owns)
+    jobs.import_saved_ids('saved_ids.txt')
+    if requeue:
+        jobs.requeue()
+    jobs.log_counts()
+    return jobs
+
+
+# seconds between checks of the job store while other workers have products in flight, that may fail and be retried
+IN_FLIGHT_POLL = 1
+
+
+def next_lease_wait(jobs, in_flight=()):
+    """
+    :param in_flight:
+    product ids being scraped by other workers
+    :return:
+    seconds to wait before leasing again when nothing can be leased now, or None when no product is left
+    """
+    wait = jobs.next_retry()
+    if wait is None and in_flight:
+        return IN_FLIGHT_POLL
+    return wait
+
+
+def lease_product(jobs, in_flight=()):
+    """
+    :param in_flight:
+    product ids being scraped by other workers. While there are any, leasing waits for them to finish,
+    as they may fail and be retried
+    :return:
+    the next product id leased, waiting for a failed product to be due for its retry if there is nothing else to do,
+    or None when no product is left
+    """
+    while True:
+        leased = jobs.lease()
+        if leased:
+            return leased[0]
+
+        wait = next_lease_wait(jobs, in_flight)
+        if wait is None:
+            return None
+        nap(round(wait, 1), "retrying the failed products")
+
+
+def merge_partial_results(file_name: str, q_and_a, question_ids: set):
+    """
+    Adds to the output the questions saved by previous failed attempts of the product and not got by this one,
+    removing the files of the failed attempts
+    :param file_name:
+    name of the output file of the product, without extension
+    :param question_ids:
+    ids of the questions already written by this attempt
+    """
+    from shard import questions_from
+
+    for file in sorted(Path().glob(f"{glob.escape(file_name)}_error.json*")):
+        merged = 0
+        for question in questions_from(file):
+            if question['id'] not in question_ids:
+                question_ids.add(question['id'])
+                q_and_a.write(question)
+                merged += 1
+        file.unlink()
+        Logger.log(f"Merged {merged} questions from '{file}', saved by a previous attempt")
+
+
+def product_start_page(base_url: str, transport: Transport, product_id: str, product_metadata='product'):
     """
-    Saves q & a from each product in a separate file
+    :return:
+    the page where scrapping the product starts: the product page if the product data comes from it,
+    otherwise the first questions page
     """
-    saved_ids_file = 'saved_ids.txt'
-    saved_ids = []
+    if product_metadata == 'product':
+        return ProductPage.from_product_id(base_url=base_url, product_id=product_id, transport=transport)
+    return QuestionsPage.from_product_id(base_url=base_url, product_id=product_id, transport=transport)
 
-    if Path(saved_ids_file).exists():
-        with open(saved_ids_file, 'r') as f:
-            saved_ids = f.read().split('\n')
 
-    with open(filename, 'r') as f:
-        prod_ids = f.read().split('\n')
+def product_questions(page, product_id: str, max_q_per_prod=-1, max_ans_per_q=-1, product_metadata='product'):
+    """
+    :return:
+    the questions of the product one by one, from its start page
+    """
+    if product_metadata == 'product':
+        return page.product_questions(max_q_per_prod, max_ans_per_q)
+    return page.product_questions(product_id, max_q_per_prod, max_ans_per_q, product_metadata)
+
+
+def product_questions_async(page, product_id: str, max_q_per_prod=-1, max_ans_per_q=-1, product_metadata='product'):
+    """
+    Async counterpart of product_questions()
+    """
+    if product_metadata == 'product':
+        return page.product_questions_async(max_q_per_prod, max_ans_per_q)
+    return page.product_questions_async(product_id, max_q_per_prod, max_ans_per_q, product_metadata)
 
-    # Remove ids already saved
-    remaining_ids = [pid for pid in prod_ids if pid not in saved_ids]
 
-    if max_prod > 0:
-        remaining_ids = remaining_ids[:max_prod]
+def incremental_questions(seen, page, product_id: str, max_q_per_prod=-1, max_ans_per_q=-1,
+                          product_metadata='product'):
+    """
+    :return:
+    the questions of the product that are new or changed since they were recorded in the seen index, one by one
+    """
+    if product_metadata == 'product':
+        questions_page, product = page.questions_page()
+        page.release()
+        return seen.changed_questions(questions_page, product_id, product, max_q_per_prod, max_ans_per_q)
+    return seen.changed_questions(page, product_id, None, max_q_per_prod, max_ans_per_q, product_metadata)
+
+
+def save_q_and_a_from_pids(base_url: str, transport: Transport, filename: str, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1,
+                           product_metadata='product', incremental=False, requeue=False, output_suffix="",
+                           shard=None):
+    """
+    Saves q & a from each product in a separate file.
+    Products are leased from the job store of the file, so several processes can work on the same file
+    :param incremental:
+    if True, only the questions new or changed since the previous crawl are saved, in a delta file per product
+    :param requeue:
+    if True, the products already done are scraped again
+    :param output_suffix:
+    added to the product id in the name of the output files, e.g. the language
+    :param shard:
+    if set, only the products of the shard are scraped
+    """
+    jobs = open_jobs(filename, requeue, shard)
+    seen = None
+    if incremental:
+        from incremental import SeenIndex
+        seen = SeenIndex.from_config()
+        # changes are found in the questions and answers pages: cached copies would hide them
+        transport = transport.revalidating('QuestionsPage', 'AnswersPage')
+
+    products = set()
+    while True:
+        prod_id = lease_product(jobs)
+        if prod_id is None:
+            break
+        if prod_id not in products and 0 < max_prod <= len(products):
+            jobs.release(prod_id)
+            break
+        products.add(prod_id)
 
-    for prod_id in remaining_ids:
         suffix = ""
-        q_and_a = []
+        question_ids = set()
+        if seen:
+            q_and_a = open_records(f"{prod_id}{output_suffix}_delta_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+        else:
+            q_and_a = open_records(f"{prod_id}{output_suffix}")
         try:
-            product_page = ProductPage.from_product_id(base_url=base_url, product_id=prod_id, headers=headers)
-            for question in product_page.product_questions(max_q_per_prod, max_ans_per_q):
-                q_and_a.append(question)
+            start_page = product_start_page(base_url, transport, prod_id, product_metadata)
+            if seen:
+                questions = incremental_questions(seen, start_page, prod_id, max_q_per_prod, max_ans_per_q,
+                                                  product_metadata)
+            else:
+                questions = product_questions(start_page, prod_id, max_q_per_prod, max_ans_per_q, product_metadata)
+
+            for question in questions:
+                q_and_a.write(question)
+                question_ids.add(question.id)
 
-            with open(saved_ids_file, 'a') as f:
-                f.write(prod_id + '\n')
+            jobs.complete(prod_id)
+            if seen:
+                seen.commit()
 
         except Exception as e:
-            Logger.log(f"Exception while getting Q&A for product {prod_id}! ", e)
-            Logger.log(traceback.format_exc())
+            Logger.error(f"Exception while getting Q&A for product {prod_id}! ", e)
+            Logger.error(traceback.format_exc())
+            jobs.fail(prod_id, e)
+            if seen:
+                seen.rollback()
             suffix = "_error"
             Logger.log("Saving remains...")
 
-        savefile(q_and_a, f"{prod_id}{suffix}", file_format='json')
+        if not seen:
+            merge_partial_results(f"{prod_id}{output_suffix}", q_and_a, question_ids)
+        q_and_a.close(suffix)
+
+    jobs.log_counts()
+
+
+def save_q_and_a_from_pids_scheduled(base_url: str, transport: Transport, filename: str, max_prod=-1,
+                                     max_q_per_prod=-1, max_ans_per_q=-1, product_metadata='product',
+                                     requeue=False, output_suffix="", shard=None, budget=None):
+    """
+    Same as save_q_and_a_from_pids, with the products leased by priority and scraped in chunks of questions pages.
+    A product not finished in its chunk goes back to the queue and continues from where it stopped,
+    in this run or in the next one, saved in a file per chunk
+    :param budget:
+    time and requests the run may use. When it is exhausted the current chunk stops and no more products are leased
+    """
+    from scheduler import Budget, ProductChunk
+
+    settings = config['scheduler']
+    budget = budget or Budget.from_config()
+    jobs = open_jobs(filename, requeue, shard)
+    jobs.set_priority(**{weight.replace('-', '_'): value for weight, value in settings['priority'].items()})
+
+    products = set()
+    while True:
+        if budget.exhausted():
+            Logger.log(f"Budget exhausted: {budget}")
+            break
+
+        prod_id = lease_product(jobs)
+        if prod_id is None:
+            break
+        if prod_id not in products and 0 < max_prod <= len(products):
+            jobs.release(prod_id)
+            break
+        products.add(prod_id)
+
+        chunk = ProductChunk(base_url, transport, prod_id, jobs.cursor(prod_id), product_metadata)
+        chunk_name = f"_chunk{chunk.number:03}" if chunk.number > 1 else ""
+        q_and_a = open_records(f"{prod_id}{output_suffix}{chunk_name}")
+        suffix = ""
+        question_ids = set()
+        try:
+            for question in chunk.questions(settings['chunk-pages'], budget, max_q_per_prod, max_ans_per_q):
+                q_and_a.write(question)
+                question_ids.add(question.id)
+
+            if chunk.finished:
+                jobs.complete(prod_id, (chunk.product or {}).get('product_ratings_count'), chunk.question_count)
+            else:
+                Logger.log(f"Product {prod_id} continues in chunk {chunk.number + 1}"
+                           f" after {chunk.question_count} questions")
+                jobs.pause(prod_id, chunk.next_cursor())
+
+        except Exception as e:
+            Logger.error(f"Exception while getting Q&A for product {prod_id}! ", e)
+            Logger.error(traceback.format_exc())
+            jobs.fail(prod_id, e)
+            suffix = "_error"
+            Logger.log("Saving remains...")
+
+        # a failed chunk is retried from the same cursor
+        merge_partial_results(f"{prod_id}{output_suffix}{chunk_name}", q_and_a, question_ids)
+        q_and_a.close(suffix)
+
+    jobs.log_counts()
+
+
+async def save_q_and_a_from_pids_async(base_url: str, transport: Transport, filename: str,
+                                       max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1, product_metadata='product',
+                                       requeue=False, output_suffix="", shard=None):
+    """
+    Async version of save_q_and_a_from_pids:
+    several products are scraped at once, each one saved in a separate file
+    """
+    import asyncio
+
+    jobs = open_jobs(filename, requeue, shard)
+    products = set()
+    in_flight = set()
+
+    async def worker():
+        while True:
+            leased = jobs.lease()
+            if not leased:
+                wait = next_lease_wait(jobs, in_flight)
+                if wait is None:
+                    break
+                await asyncio.sleep(wait)
+                continue
+
+            prod_id = leased[0]
+            if prod_id not in products and 0 < max_prod <= len(products):
+                jobs.release(prod_id)
+                break
+            products.add(prod_id)
+            in_flight.add(prod_id)
+
+            suffix = ""
+            question_ids = set()
+            q_and_a = open_records(f"{prod_id}{output_suffix}")
+            try:
+                start_page = product_start_page(base_url, transport, prod_id, product_metadata)
+                async for question in product_questions_async(start_page, prod_id,
+                                                              max_q_per_prod, max_ans_per_q, product_metadata):
+                    q_and_a.write(question)
+                    question_ids.add(question.id)
+
+                jobs.complete(prod_id)
+
+            except Exception as e:
+                Logger.error(f"Exception while getting Q&A for product {prod_id}! ", e)
+                Logger.error(traceback.format_exc())
+                jobs.fail(prod_id, e)
+                suffix = "_error"
+                Logger.log("Saving remains...")
+            finally:
+                in_flight.discard(prod_id)
+
+            merge_partial_results(f"{prod_id}{output_suffix}", q_and_a, question_ids)
+            q_and_a.close(suffix)
+
+    await asyncio.gather(*[worker() for _ in range(config['concurrency']['products'])])
+    jobs.log_counts()
+
+
+def save_q_and_a_from_pids_pipelined(base_url: str, transport: Transport, filename: str,
+                                     max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1, product_metadata='product',
+                                     requeue=False, output_suffix="", shard=None):
+    """
+    Pipelined version of save_q_and_a_from_pids:
+    pages are fetched by several threads and parsed in a pool of processes, each product saved in a separate file
+    """
+    from pipeline import Pipeline
+
+    jobs = open_jobs(filename, requeue, shard)
+    in_flight = set()
+
+    def leased_product_pages():
+        products = set()
+        while True:
+            prod_id = lease_product(jobs, in_flight)
+            if prod_id is None:
+                return
+            if prod_id not in products and 0 < max_prod <= len(products):
+                jobs.release(prod_id)
+                return
+            products.add(prod_id)
+            in_flight.add(prod_id)
+
+            yield prod_id, product_start_page(base_url, transport, prod_id, product_metadata)
+
+    def product_done(prod_id, exception):
+        # runs in the fetch thread, before it takes its next product: a failed product is retried in this run
+        if exception is None:
+            jobs.complete(prod_id)
+        else:
+            jobs.fail(prod_id, exception)
+        in_flight.discard(prod_id)
+
+    with Pipeline.from_config() as pipeline:
+        for prod_id, questions, exception in pipeline.scrap(leased_product_pages(), max_q_per_prod, max_ans_per_q,
+                                                            product_metadata, product_done):
+            suffix = ""
+            if exception is not None:
+                Logger.error(f"Exception while getting Q&A for product {prod_id}! ", exception)
+                suffix = "_error"
+                Logger.log("Saving remains...")
+
+            q_and_a = open_records(f"{prod_id}{output_suffix}")
+            for question in questions:
+                q_and_a.write(question)
+            merge_partial_results(f"{prod_id}{output_suffix}", q_and_a, {question.id for question in questions})
+            q_and_a.close(suffix)
+
+    jobs.log_counts()
 
 
 def save_q_and_a(base_name: str, result_page: ResultsPage,
-                 max_pag=-1, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1):
+                 max_pag=-1, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1, shard=None):
     """
     Saves q & a checkpoints per each results page,
     sequential navigation
+    :param shard:
+    if set, only the products of the shard are scraped
     """
     page_counter = 1
     suffix = ""
-    q_and_a = []
+    q_and_a = open_records(f"{base_name}_p{page_counter:03}")
     try:
         for product, page_count in result_page.items_to_end(max_prod):
-            if page_counter > max_pages >= 0:
+            if page_counter > max_pag >= 0:
                 Logger.log(f"Maximum number of pages reached! ({max_pag})")
                 break
 
             if page_count != page_counter:
-                savefile(q_and_a, f"{base_name}_p{page_counter:03}")
+                q_and_a.close()
                 Logger.log(f"Saved page {page_counter:03}...")
                 page_counter = page_count
-                q_and_a = []
+                q_and_a = open_records(f"{base_name}_p{page_counter:03}")
+
+            if shard and not shard.owns(product_id_of(product)):
+                continue
 
             for question in product.product_questions(max_q_per_prod, max_ans_per_q):
-                q_and_a.append(question)
+                q_and_a.write(question)
 
     except Exception as e:
-        Logger.log("Exception while getting Q&A! ", e)
-        Logger.log(traceback.format_exc())
+        Logger.error("Exception while getting Q&A! ", e)
+        Logger.error(traceback.format_exc())
         suffix = "_error"
         Logger.log("Saving remains...")
 
-    savefile(q_and_a, f"{base_name}_p{page_counter:03}{suffix}")
+    q_and_a.close(suffix)
+
+
+async def save_q_and_a_async(base_name: str, result_page: ResultsPage,
+                             max_pag=-1, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1, shard=None):
+    """
+    Async version of save_q_and_a:
+    the products of each results page are scraped at once, keeping their order in the output
+    """
+    import asyncio
+
+    products_limit = asyncio.Semaphore(config['concurrency']['products'])
+
+    async def product_q_and_a(product: ProductPage):
+        async with products_limit:
+            return [q async for q in product.product_questions_async(max_q_per_prod, max_ans_per_q)]
+
+    async def page_q_and_a(products, q_and_a):
+        """
+        Writes the Q&A of all the products in order, up to the first product that failed
+        """
+        for result in await asyncio.gather(*[product_q_and_a(p) for p in products], return_exceptions=True):
+            if isinstance(result, Exception):
+                raise result
+            for question in result:
+                q_and_a.write(question)
+
+    page_counter = 1
+    suffix = ""
+    q_and_a = open_records(f"{base_name}_p{page_counter:03}")
+    products = []
+    try:
+        async for product, page_count in result_page.items_to_end_async(max_prod):
+            if page_counter > max_pag >= 0:
+                Logger.log(f"Maximum number of pages reached! ({max_pag})")
+                break
+
+            if page_count != page_counter:
+                await page_q_and_a(products, q_and_a)
+                q_and_a.close()
+                Logger.log(f"Saved page {page_counter:03}...")
+                page_counter = page_count
+                q_and_a = open_records(f"{base_name}_p{page_counter:03}")
+                products = []
+
+            if shard is None or shard.owns(product_id_of(product)):
+                products.append(product)
+
+        await page_q_and_a(products, q_and_a)
+
+    except Exception as e:
+        Logger.error("Exception while getting Q&A! ", e)
+        Logger.error(traceback.format_exc())
+        suffix = "_error"
+        Logger.log("Saving remains...")
+
+    q_and_a.close(suffix)
+
+
+def limit_union(limit: int, other: int):
+    """
+    :return:
+    the limit that covers both limits, where -1 means no limit
+    """
+    return -1 if -1 in (limit, other) else max(limit, other)
+
+
+def load_manifest(manifest_file: str, defaults: dict):
+    """
+    Reads the jobs of a batch manifest: a YAML file with a list of jobs under 'jobs', each one with a keyword,
+    and optionally a language and limits. Settings missing in a job are taken from 'defaults' in the manifest,
+    and then from the defaults provided
+    :return:
+    the jobs, with every setting filled in
+    """
+    import yaml
+
+    with open(manifest_file, 'r') as f:
+        manifest = yaml.safe_load(f)
+
+    defaults = {**defaults, **(manifest.get('defaults') or {})}
+    jobs = []
+    for job in manifest['jobs']:
+        if not job.get('keyword'):
+            raise ValueError(f"Job without keyword in {manifest_file}: {job}")
+        jobs.append({**defaults, **job})
+    return jobs
+
+
+def job_product_ids(batch_name: str, job: dict, base_url: str, transport: Transport):
+    """
+    :return:
+    the product ids found by the job, from its product ids file if a previous run saved it,
+    otherwise navigating its results pages
+    """
+    filename = f"{batch_name}_{job['keyword'].replace(' ', '_')}_{job['language']}_prod_ids.txt"
+    if Path(filename).exists():
+        Logger.log(f"Product ids for '{job['keyword']}' in '{job['language']}' taken from {filename}")
+        with open(filename, 'r') as f:
+            return [pid for pid in f.read().split('\n') if pid]
+
+    Logger.log(f"Searching for '{job['keyword']}' in '{job['language']}' language")
+    results_page = ResultsPage(base_url, config['request']['parameters'].format(keyword=job['keyword']), transport)
+    prod_ids = []
+    try:
+        prod_ids += product_ids(results_page, job['max-pages'], job['max-products'])
+    except Exception as e:
+        # the ids found are scraped, and the results pages are navigated again on the next run
+        Logger.error(f"Exception while getting Product ids for '{job['keyword']}'! ", e)
+        Logger.error(traceback.format_exc())
+        return prod_ids
+
+    savefile(prod_ids, filename[:-len(".txt")], file_format='txt')
+    return prod_ids
+
+
+def save_q_and_a_batch(manifest_file: str, base_url: str, transport: Transport, defaults: dict,
+                       use_async=False, use_pipeline=False, product_metadata='product', incremental=False,
+                       requeue=False, shard=None):
+    """
+    Runs the jobs of a batch manifest in this process, all of them sharing the connections, rate limits and cache.
+    First the product ids of every job are collected from its results pages, then each product is scraped
+    once per language, even if several jobs found it, with the highest limits of those jobs.
+    Each product is saved in a file named <product id>_<language>, and the products of each job are listed in a file
+    :param defaults:
+    language and limits of the jobs that do not set them
+    :param shard:
+    if set, only the products of the shard are scraped. Every shard collects the product ids of all the jobs
+    """
+    jobs = load_manifest(manifest_file, defaults)
+    batch_name = Path(manifest_file).stem
+
+    transports = {}
+    # (language, product id): (max questions, max answers), in the order the products were found
+    limits = {}
+    found = 0
+    for job in jobs:
+        language = job['language']
+        if language not in transports:
+            transports[language] = transport.for_language(language)
+
+        for product_id in job_product_ids(batch_name, job, base_url, transports[language]):
+            found += 1
+            max_q, max_a = limits.get((language, product_id), (0, 0))
+            limits[(language, product_id)] = (limit_union(max_q, job['max-questions-per-product']),
+                                              limit_union(max_a, job['max-answers-per-question']))
+
+    Logger.log(f"{found} products found by {len(jobs)} jobs, {len(limits)} different products per language")
+    Logger.log()
+
+    # products with the same language and limits are scraped from one product ids file, with its own job store
+    groups = {}
+    for (language, product_id), (max_q, max_a) in limits.items():
+        groups.setdefault((language, max_q, max_a), []).append(product_id)
+
+    groups_args = []
+    for (language, max_q, max_a), group_ids in groups.items():
+        filename = f"{batch_name}_{language}_{max_q}_{max_a}.txt"
+        with open(filename, 'w') as f:
+            f.write("\n".join(group_ids) + "\n")
+
+        groups_args.append(dict(base_url=base_url, transport=transports[language], filename=filename,
+                                max_q_per_prod=max_q, max_ans_per_q=max_a, product_metadata=product_metadata,
+                                requeue=requeue, output_suffix=f"_{language}", shard=shard))
+
+    if use_async and not incremental:
+        import asyncio
+
+        # one event loop for all the groups: the fetch limits are bound to the loop that first used them
+        async def scrap_groups():
+            for group_args in groups_args:
+                await save_q_and_a_from_pids_async(**group_args)
+
+        asyncio.run(scrap_groups())
+        return
+
+    for group_args in groups_args:
+        if use_pipeline and not incremental:
+            save_q_and_a_from_pids_pipelined(**group_args)
+        else:
+            save_q_and_a_from_pids(**group_args, incremental=incremental)
+
+
+def reparse_product(archive_path: str, base_url: str, language: str, product_id: str, max_q_per_prod=-1,
+                    max_ans_per_q=-1, product_metadata='product', output_suffix=""):
+    """
+    Runs in a reparse process: extracts the questions of the product from the pages in the archive,
+    saving them in a file as when scrapping by product id
+    :param output_suffix:
+    added to the product id in the name of the file, e.g. the language
+    :return:
+    the product id, the number of questions saved, and the error if extracting failed
+    """
+    from archive import archive_transport
+
+    suffix = ""
+    error = None
+    question_count = 0
+    q_and_a = open_records(f"{product_id}{output_suffix}")
+    try:
+        start_page = product_start_page(base_url, archive_transport(archive_path, language), product_id,
+                                        product_metadata)
+        for question in product_questions(start_page, product_id, max_q_per_prod, max_ans_per_q, product_metadata):
+            q_and_a.write(question)
+            question_count += 1
+
+    except Exception as e:
+        Logger.error(f"Exception while reparsing product {product_id}! ", e)
+        Logger.error(traceback.format_exc())
+        error = repr(e)
+        suffix = "_error"
+
+    q_and_a.close(suffix)
+    return product_id, question_count, error
+
+
+def reparse_archive(archive_path: str, base_url: str, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1,
+                    product_metadata='product', processes=None, shard=None):
+    """
+    Extracts again the questions of every product in the archive with the current extraction code,
+    without any request, in a pool of processes. Each product is saved in a separate file
+    :param processes:
+    number of processes, all the cores if None
+    :param shard:
+    if set, only the products of the shard are extracted
+    """
+    from archive import ResponseArchive
+
+    if not Path(archive_path).is_dir():
+        raise ValueError(f"There is no archive in '{archive_path}'")
+
+    # without the product page, products are found by their questions pages
+    archive = ResponseArchive(archive_path)
+    products = archive.product_ids('ProductPage' if product_metadata == 'product' else 'QuestionsPage')
+    archive.close()
+    if shard:
+        products = [(language, product_id) for language, product_id in products if shard.owns(product_id)]
+    if max_prod >= 0:
+        products = products[:max_prod]
+
+    # a product archived in several languages is saved in a file for each one, named as in --batch
+    several_languages = len({language for language, _ in products}) > 1
+
+    Logger.log(f"Reparsing {len(products)} products from the archive in '{archive_path}'")
+    failed = 0
+    with process_pool(processes) as pool:
+        futures = [pool.submit(reparse_product, archive_path, base_url, language, product_id,
+                               max_q_per_prod, max_ans_per_q, product_metadata,
+                               f"_{language}" if several_languages else "")
+                   for language, product_id in products]
+        for future in futures:
+            product_id, question_count, error = future.result()
+            if error:
+                failed += 1
+            Logger.debug(f"Reparsed product {product_id}: {question_count} questions"
+                         + (f", failed with {error}" if error else ""))
+
+    Logger.log(f"Reparsed {len(products) - failed} products, {failed} failed")
 
 
 def get_questions(result_page: ResultsPage, max_prod=-1, max_q_per_prod=-1, max_ans_per_q=-1):
@@ -137,7 +822,6 @@ def get_questions(result_page: ResultsPage, max_prod=-1, max_q_per_prod=-1, max_
     """
     q_and_a = []
     for product, page_count in result_page.items_to_end(max_prod):
-        nap(3, "fetching next product")
         for question in product.product_questions(max_q_per_prod, max_ans_per_q):
             q_and_a.append(question)
 
@@ -145,17 +829,6 @@ def get_questions(result_page: ResultsPage, max_prod=-1, max_q_per_prod=-1, max_
 
 
 if __name__ == '__main__':
-    # Getting data from config file
-    request = config['request']
-    headers = config['request-headers']
-    max_pages = config['max-pages']
-    max_products = config['max-products']
-    max_questions_per_product = config['max-questions-per-product']
-    max_answers_per_question = config['max-answers-per-question']
-
-    save_prod_ids = config['save-prod-ids']
-    scrap_prod_ids = config['scrap-prod-ids']
-
     # Override language and search term with command line parameters, if any
     parser = argparse.ArgumentParser(description="Amazing web Q&A educational scrapper")
     parser.add_argument("-l", "--lang", help="Language for the results, e.g. en, es, ...")
@@ -174,7 +847,82 @@ if __name__ == '__main__':
     parser.add_argument("--scrap-prod-ids", metavar="PROD_IDS_FILENAME",
                         help="Runs the parser targeted to the prod ids obtained from the file.")
 
+    parser.add_argument("--batch", metavar="MANIFEST_FILENAME",
+                        help="Runs the keyword and language jobs from the manifest file in this process, "
+                             "scraping each product once per language.")
+
+    parser.add_argument("--async", dest="use_async", action='store_true',
+                        help="Scraps several products at once, with the limits set in the config file.")
+    parser.set_defaults(use_async=False)
+
+    parser.add_argument("--pipeline", dest="use_pipeline", action='store_true',
+                        help="When scrapping by product ids, fetches pages in several threads "
+                             "and parses them in a pool of processes.")
+    parser.set_defaults(use_pipeline=False)
+
+    parser.add_argument("--product-metadata", choices=['product', 'questions', 'off'],
+                        help="When scrapping by product ids, where the product name and ratings count come from: "
+                             "the product page, the questions page (skipping the product page), "
+                             "or off (left empty, skipping the product page).")
+
+    parser.add_argument("--incremental", action='store_true',
+                        help="When scrapping by product ids, saves only the questions new or changed "
+                             "since the previous crawl, in a delta file per product.")
+    parser.set_defaults(incremental=False)
+
+    parser.add_argument("--requeue", action='store_true',
+                        help="When scrapping by product ids, scraps again the products already done.")
+    parser.set_defaults(requeue=False)
+
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Scraps only the products of shard I of N, e.g. 2/4, split by a hash of their ids, "
+                             "for crawls spread across several nodes. Merge the outputs with shard.py")
+
+    parser.add_argument("--budget-minutes", type=float, metavar="MINUTES",
+                        help="When scrapping by product ids, stops after the minutes given, leasing the products"
+                             " by priority and scrapping them in chunks of questions pages that the next run continues.")
+    parser.add_argument("--budget-requests", type=int, metavar="REQUESTS",
+                        help="Same as --budget-minutes, stopping after the number of requests given.")
+
+    parser.add_argument("--reparse", metavar="ARCHIVE_DIR", nargs='?', const="",
+                        help="Extracts the questions again from the pages in the archive (the one in the config file"
+                             " by default), without any request, using all the cores.")
+
+    parser.add_argument("--profile", metavar="STATS_FILENAME", nargs='?', const="scrapper.prof",
+                        help="Runs the scrapper under cProfile, saving the stats in the file (scrapper.prof by default)"
+                             " and logging the functions that took the longest.")
+
+    parser.add_argument("-c", "--config", default="config.yml", metavar="CONFIG_FILENAME",
+                        help="Config file to use, config.yml by default.")
+
     args = parser.parse_args()
+    config.load(args.config)
+
+    shard = None
+    if args.shard:
+        from shard import Shard
+        try:
+            shard = Shard.parse(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+
+    # Getting data from config file
+    request = config['request']
+    headers = config['request-headers']
+    max_pages = config['max-pages']
+    max_products = config['max-products']
+    max_questions_per_product = config['max-questions-per-product']
+    max_answers_per_question = config['max-answers-per-question']
+
+    save_prod_ids = config['save-prod-ids']
+    scrap_prod_ids = config['scrap-prod-ids']
+    use_async = config['concurrency']['async']
+    use_pipeline = config['pipeline']['enabled']
+    product_metadata = config['product-metadata']
+    incremental = config['incremental']['enabled']
+    scheduled = config['scheduler']['enabled']
+    budget_minutes = config['scheduler']['max-minutes']
+    budget_requests = config['scheduler']['max-requests']
 
     if args.lang:
         headers['Accept-Language'] = args.lang
@@ -200,6 +948,39 @@ if __name__ == '__main__':
     if args.scrap_prod_ids:
         scrap_prod_ids = args.scrap_prod_ids
 
+    if args.use_async:
+        use_async = args.use_async
+
+    if args.use_pipeline:
+        use_pipeline = args.use_pipeline
+
+    if args.product_metadata:
+        product_metadata = args.product_metadata
+
+    if args.incremental:
+        incremental = args.incremental
+
+    if args.budget_minutes is not None:
+        budget_minutes = args.budget_minutes
+        scheduled = True
+
+    if args.budget_requests is not None:
+        budget_requests = args.budget_requests
+        scheduled = True
+
+    budget_given = args.budget_minutes is not None or args.budget_requests is not None
+    if budget_given and (not scrap_prod_ids or save_prod_ids or args.batch or args.reparse is not None):
+        # the budget would be ignored: only the products scraped by product id are scheduled
+        parser.error("--budget-minutes and --budget-requests only apply when scrapping by product ids")
+
+    if incremental and (scrap_prod_ids or args.batch) and (use_pipeline or use_async):
+        Logger.log("Incremental mode runs sequentially, ignoring --async and --pipeline")
+        use_pipeline = use_async = False
+
+    if scheduled and scrap_prod_ids and (use_pipeline or use_async or incremental):
+        Logger.log("Scheduled mode runs sequentially, ignoring --async, --pipeline and --incremental")
+        use_pipeline = use_async = incremental = False
+
     # File to save output
     if save_prod_ids:
         filename = (f"prod_ids"
@@ -216,33 +997,118 @@ if __name__ == '__main__':
                     f"_{max_answers_per_question}"
                     )
 
+    # the job stores of the product ids files are kept per shard instead
+    if shard and not scrap_prod_ids:
+        filename += f"_{shard.name}"
+
     Logger.log("Welcome to Amazing Q&A educational scrapper")
     Logger.log()
-    Logger.log(f"Searching for '{request['keyword']}' in '{headers['Accept-Language']}' language")
+    if args.batch:
+        Logger.log(f"Running the jobs in '{args.batch}', by default")
+    else:
+        Logger.log(f"Searching for '{request['keyword']}' in '{headers['Accept-Language']}' language")
     Logger.log(f"Aiming to retrieve"
                f" {'max' if max_answers_per_question == -1 else max_answers_per_question} answers per question"
                f", {'max' if max_questions_per_product == -1 else max_questions_per_product} questions per product"
                f", {'max' if max_products == -1 else max_products} products"
                f", {'max' if max_pages == -1 else max_pages} pages.")
+    if shard:
+        Logger.log(f"Only the products of shard {shard}")
+    if scheduled and scrap_prod_ids:
+        Logger.log(f"Scheduled by priority, in chunks of {config['scheduler']['chunk-pages']} questions pages"
+                   f", for {budget_minutes or 'unlimited'} minutes and {budget_requests or 'unlimited'} requests")
 
     Logger.log()
 
+    transport = Transport.from_config(headers)
+
     results_page = ResultsPage(request['url-base'],
                                request['parameters'].format(keyword=request['keyword']),
-                               headers)
+                               transport)
 
-    if save_prod_ids:
-        save_product_ids(filename, results_page,
+    with exporting_metrics(), profiling(args.profile):
+        if args.reparse is not None:
+            reparse_archive(args.reparse or config['archive']['path'], base_url=request['url-base'],
+                            max_prod=max_products,
+                            max_q_per_prod=max_questions_per_product,
+                            max_ans_per_q=max_answers_per_question,
+                            product_metadata=product_metadata,
+                            processes=config['archive']['reparse-processes'] or None,
+                            shard=shard)
+        elif args.batch:
+            save_q_and_a_batch(args.batch, base_url=request['url-base'], transport=transport,
+                               defaults={'language': headers['Accept-Language'],
+                                         'max-pages': max_pages,
+                                         'max-products': max_products,
+                                         'max-questions-per-product': max_questions_per_product,
+                                         'max-answers-per-question': max_answers_per_question},
+                               use_async=use_async,
+                               use_pipeline=use_pipeline,
+                               product_metadata=product_metadata,
+                               incremental=incremental,
+                               requeue=args.requeue,
+                               shard=shard)
+        elif save_prod_ids:
+            save_product_ids(filename, results_page,
+                             max_pag=max_pages,
+                             max_prod=max_products,
+                             shard=shard)
+        elif scrap_prod_ids and scheduled:
+            from scheduler import Budget
+            save_q_and_a_from_pids_scheduled(base_url=request['url-base'], transport=transport, filename=filename,
+                                             max_prod=max_products,
+                                             max_q_per_prod=max_questions_per_product,
+                                             max_ans_per_q=max_answers_per_question,
+                                             product_metadata=product_metadata,
+                                             requeue=args.requeue,
+                                             shard=shard,
+                                             budget=Budget(budget_minutes, budget_requests))
+        elif scrap_prod_ids and use_pipeline:
+            save_q_and_a_from_pids_pipelined(base_url=request['url-base'], transport=transport, filename=filename,
+                                             max_prod=max_products,
+                                             max_q_per_prod=max_questions_per_product,
+                                             max_ans_per_q=max_answers_per_question,
+                                             product_metadata=product_metadata,
+                                             requeue=args.requeue,
+                                             shard=shard)
+        elif scrap_prod_ids and use_async:
+            import asyncio
+            asyncio.run(save_q_and_a_from_pids_async(base_url=request['url-base'], transport=transport,
+                                                     filename=filename,
+                                                     max_prod=max_products,
+                                                     max_q_per_prod=max_questions_per_product,
+                                                     max_ans_per_q=max_answers_per_question,
+                                                     product_metadata=product_metadata,
+                                                     requeue=args.requeue,
+                                                     shard=shard))
+        elif scrap_prod_ids:
+            save_q_and_a_from_pids(base_url=request['url-base'], transport=transport, filename=filename,
+                                   max_prod=max_products,
+                                   max_q_per_prod=max_questions_per_product,
+                                   max_ans_per_q=max_answers_per_question,
+                                   product_metadata=product_metadata,
+                                   incremental=incremental,
+                                   requeue=args.requeue,
+                                   shard=shard)
+        elif use_async:
+            import asyncio
+            asyncio.run(save_q_and_a_async(filename, results_page,
+                                           max_pag=max_pages,
+                                           max_prod=max_products,
+                                           max_q_per_prod=max_questions_per_product,
+                                           max_ans_per_q=max_answers_per_question,
+                                           shard=shard))
+        else:
+            save_q_and_a(filename, results_page,
                          max_pag=max_pages,
-                         max_prod=max_products)
-    elif scrap_prod_ids:
-        save_q_and_a_from_pids(base_url=request['url-base'], headers=headers, filename=filename,
-                               max_prod=max_products,
-                               max_q_per_prod=max_questions_per_product,
-                               max_ans_per_q=max_answers_per_question)
-    else:
-        save_q_and_a(filename, results_page,
-                     max_pag=max_pages,
-                     max_prod=max_products,
-                     max_q_per_prod=max_questions_per_product,
-                     max_ans_per_q=max_answers_per_question)
+                         max_prod=max_products,
+                         max_q_per_prod=max_questions_per_product,
+                         max_ans_per_q=max_answers_per_question,
+                         shard=shard)
+
+    if config['results-db']['enabled']:
+        results_database().close()
+
+    transport.limiter.log_state()
+    if transport.cache:
+        transport.cache.report()
@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+from pathlib import Path
+
+import json
+import threading
+import time
+
+from config import config
+from log import Logger
+
+
+class Metrics:
+    """
+    Counters and timers of the scrapping stages, labelled e.g. by page type.
+    Timers keep the number of calls, total and max seconds of each stage
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self.started_at = time.time()
+        self._exporter = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name: str, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def total(self, name: str):
+        """
+        :return:
+        the value of the counter, added up for all its labels
+        """
+        with self.lock:
+            return sum(value for (counter, labels), value in self.counters.items() if counter == name)
+
+    def observe(self, stage: str, seconds: float, **labels):
+        key = self._key(stage, labels)
+        with self.lock:
+            calls, total, longest = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = calls + 1, total + seconds, max(longest, seconds)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def timed_items(self, stage: str, items, **labels):
+        """
+        Times the generation of each item, leaving out the time the caller spends with it
+        :return:
+        the items one by one
+        """
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.observe(stage, time.perf_counter() - start, **labels)
+                return
+            self.observe(stage, time.perf_counter() - start, **labels)
+            yield item
+
+    def snapshot(self):
+        """
+        :return:
+        the current values, as a dict that can be saved as JSON
+        """
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            timers = [{'stage': stage, 'labels': dict(labels), 'calls': calls, 'seconds': round(total, 6),
+                       'max_seconds': round(longest, 6)}
+                      for (stage, labels), (calls, total, longest) in sorted(self.timers.items())]
+
+        return {'started_at': self.started_at, 'uptime_seconds': round(time.time() - self.started_at, 3),
+                'counters': counters, 'timers': timers}
+
+    def prometheus(self):
+        """
+        :return:
+        the current values in Prometheus text exposition format
+        """
+        def series(name, labels, value):
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            return f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}"
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"scrapper_{name.replace('-', '_')}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(series(metric, labels, value))
+
+        for metric, kind, position in (("scrapper_stage_calls_total", "counter", 0),
+                                       ("scrapper_stage_seconds_total", "counter", 1),
+                                       ("scrapper_stage_seconds_max", "gauge", 2)):
+            lines.append(f"# TYPE {metric} {kind}")
+            lines += [series(metric, (('stage', stage),) + labels, values[position])
+                      for (stage, labels), values in timers]
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path=None, prometheus_path=None):
+        """
+        Writes the current values to the files, replacing them at once so readers never see half a file
+        """
+        for path, content in ((json_path, lambda: json.dumps(self.snapshot(), indent=2)),
+                              (prometheus_path, self.prometheus)):
+            if path:
+                temp = Path(f"{path}.tmp")
+                temp.write_text(content(), encoding="utf-8")
+                temp.replace(path)
+
+    def start_export(self, interval, json_path=None, prometheus_path=None):
+        """
+        Exports the values every interval seconds in a background thread, until stop_export()
+        """
+        def exporter():
+            while not self._stop.wait(interval):
+                self.export(json_path, prometheus_path)
+
+        self._exporter = threading.Thread(target=exporter, name="metrics-export", daemon=True)
+        self._exporter.start()
+
+    def stop_export(self):
+        self._stop.set()
+        if self._exporter:
+            self._exporter.join()
+
+    def log_summary(self):
+        """
+        Logs the total time spent in each stage, by label
+        """
+        with self.lock:
+            timers = sorted(self.timers.items(), key=lambda t: -t[1][1])
+
+        Logger.log("Time per stage:")
+        for (stage, labels), (calls, total, longest) in timers:
+            label_text = " ".join(f"{v}" for k, v in labels)
+            Logger.log(f"  {stage} {label_text}: {total:.3f}s in {calls} calls (max {longest:.3f}s)")
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def exporting_metrics():
+    """
+    Exports the metrics periodically while running, and once more at the end, with the settings from the config file
+    """
+    settings = config['metrics']
+    if not settings['enabled']:
+        yield
+        return
+
+    metrics.start_export(settings['interval'], settings['json-path'], settings['prometheus-path'])
+    try:
+        yield
+    finally:
+        metrics.stop_export()
+        metrics.export(settings['json-path'], settings['prometheus-path'])
+        metrics.log_summary()
+
+
+@contextmanager
+def profiling(stats_file: str = None, top=25):
+    """
+    Runs the block under cProfile, logging the functions with the highest cumulative time
+    :param stats_file:
+    if set, the raw stats are saved there, to be explored e.g. with snakeviz or pstats
+    """
+    if not stats_file:
+        yield
+        return
+
+    import cProfile
+    import io
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(stats_file)
+
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(top)
+        Logger.log(f"Profile saved in {stats_file}")
+        Logger.log(stream.getvalue())
@@ -1,30 +1,98 @@
 from abc import abstractmethod
-from dateparser.search import search_dates
-from bs4 import BeautifulSoup
-from requests import HTTPError
-from urllib.parse import urljoin
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, wraps
+from requests import ConnectionError, HTTPError, Timeout
+from urllib.parse import urljoin, urlsplit
 
+import importlib.util
 import re
-import requests
+import threading
+import time
 
 from config import config
+from dates import find_date
+from extraction import CardFields, Field
 from log import save_debug, Logger
+from metrics import metrics
+from records import Answer, Question
+from transport import Transport
 from utils import nap
 
 
+prefetch_lock = threading.Lock()
+
+
+@lru_cache
+def prefetch_pool():
+    return ThreadPoolExecutor(max_workers=config['prefetch']['workers'], thread_name_prefix="prefetch")
+
+
+@lru_cache
+def html_parser():
+    """
+    :return:
+    the parser backend set in the config file, falling back to html.parser if it is not installed
+    """
+    parser = config['html-parser']
+    if parser == 'lxml' and importlib.util.find_spec('lxml') is None:
+        Logger.warning("lxml is not installed, falling back to html.parser")
+        parser = 'html.parser'
+    return parser
+
+
+def has_class(attrs, *classes):
+    """
+    :return:
+    whether the tag attributes received by a SoupStrainer function include any of the classes
+    """
+    tag_classes = attrs.get('class') or ''
+    if isinstance(tag_classes, str):
+        tag_classes = tag_classes.split()
+    return any(c in tag_classes for c in classes)
+
+
+def timed_extraction(items):
+    """
+    Decorator for the methods that extract items from the page soup,
+    timing the extraction apart from fetching and parsing the page
+    """
+    @wraps(items)
+    def timed_items(self, *args, **kwargs):
+        self.soup
+        yield from metrics.timed_items('extract', items(self, *args, **kwargs), page=type(self).__name__)
+
+    return timed_items
+
+
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def number_from_text(text: str):
+    """
+    :return:
+    the first number in the text, e.g. a ratings count, 0 if there is no number
+    """
+    match = NUMBER_PATTERN.search(text)
+    return int(match.group()) if match else 0
+
+
 class Page:
     """
     Base class common for every page
     """
+    # parts of the page needed by its locators. If None, the whole page is parsed
+    parse_only = None
 
-    def __init__(self, base_url, parameters='', headers=None):
-        if headers is None:
-            headers = {}
+    def __init__(self, base_url, parameters='', transport: Transport = None):
+        if transport is None:
+            transport = Transport()
         self.base_url = base_url
         self.parameters = parameters
-        self.headers = headers
+        self.transport = transport
         self._url = None
         self._soup = None
+        self._prefetch = None
 
     @property
     def url(self):
@@ -32,40 +100,262 @@ class Page:
             self._url = urljoin(self.base_url, self.parameters)
         return self._url
 
+    @property
+    def host(self):
+        return urlsplit(self.url).netloc
+
     @property
     def soup(self):
         if self._soup is None:
-            self._soup = self.get_soup()
+            self._soup = self._prefetch.result() if self._prefetch else self.get_soup()
         return self._soup
 
+    def prefetch(self):
+        """
+        Starts fetching the page in the background, unless it was already fetched
+        :return:
+        future of the page soup
+        """
+        with prefetch_lock:
+            if self._prefetch is None:
+                if self._soup is not None:
+                    self._prefetch = Future()
+                    self._prefetch.set_result(self._soup)
+                else:
+                    self._prefetch = prefetch_pool().submit(self.get_soup)
+            return self._prefetch
+
+    def prefetch_async(self):
+        """
+        Async counterpart of prefetch(): the page is fetched in a task, bounded by the fetch limits
+        :return:
+        task of the page soup
+        """
+        import asyncio
+
+        with prefetch_lock:
+            if self._prefetch is None:
+                self._prefetch = asyncio.ensure_future(self._get_soup_async())
+            return self._prefetch
+
+    async def soup_async(self):
+        """
+        Async counterpart of the soup property:
+        the blocking request runs in a worker thread, bounded by the fetch limits
+        """
+        import asyncio
+
+        if self._soup is None and self._prefetch is not None:
+            # wrap_future leaves the tasks of prefetch_async() as they are
+            self._soup = await asyncio.wrap_future(self._prefetch)
+        if self._soup is None:
+            soup = await self._get_soup_async()
+            # another coroutine may have fetched it meanwhile
+            if self._soup is None:
+                self._soup = soup
+        return self._soup
+
+    async def _get_soup_async(self):
+        import asyncio
+        from concurrency import fetch_limits
+
+        async with fetch_limits().slot(self.host):
+            return await asyncio.to_thread(self.get_soup)
+
     def get_soup(self):
+        page_type = type(self).__name__
+        with metrics.timer('fetch', page=page_type):
+            content = self.fetch()
+        with metrics.timer('parse', page=page_type):
+            return self.parse(content)
+
+    def parse(self, content):
+        """
+        Builds the soup of the page from its content, already fetched
+        :return:
+        the soup
+        """
+        parse_only = self.parse_only if config['partial-parsing'] else None
+        self._soup = BeautifulSoup(content, html_parser(), parse_only=parse_only)
+        return self._soup
+
+    def fetch(self):
+        """
+        :return:
+        the page content, taken from the cache while it is fresh for this page type,
+        unless the transport revalidates every cached page of the type
+        """
+        page_type = type(self).__name__
+        cache = self.transport.cache
+        archive = self.transport.archive
+        language = self.transport.language
+        cached = cache.get(self.url, language) if cache else None
+
+        headers = {}
+        if cached:
+            if (time.time() - cached.stored_at < cache.ttl(page_type)
+                    and page_type not in self.transport.revalidated_pages):
+                cache.hits += 1
+                metrics.count('cache-hits', page=page_type)
+                # pages cached before the archive was enabled are archived once
+                if archive and not archive.contains(self.url, language):
+                    archive.append(self.url, language, page_type, 200, cached.content)
+                return cached.content
+
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
         attempt_number = config['request-attempts']
 
         for i in range(1, attempt_number + 1):
-            Logger.log(f"{i}{'st' if i == 1 else 'nd' if i == 2 else 'rd' if i == 3 else 'th'}"
+            Logger.debug(f"{i}{'st' if i == 1 else 'nd' if i == 2 else 'rd' if i == 3 else 'th'}"
                        f" attempt of request to {self.url}")
 
-            r = requests.get(self.url, headers=self.headers)
-
-            if 200 <= r.status_code < 400:
-                return BeautifulSoup(r.content, 'html.parser')
+            metrics.count('requests', page=page_type)
+            try:
+                with metrics.timer('request', page=page_type):
+                    r = self.transport.get(self.url, headers)
+            except (ConnectionError, Timeout) as e:
+                Logger.warning(f"Request failed: {e}")
+                metrics.count('request-errors', page=page_type, error=type(e).__name__)
+            else:
+                metrics.count('responses', page=page_type, status=r.status_code)
+                metrics.count('response-bytes', len(r.content), page=page_type)
+
+                if r.status_code == 304 and cached:
+                    cache.revalidated += 1
+                    cache.refresh(self.url, language)
+                    if archive:
+                        archive.append(self.url, language, page_type, r.status_code, cached.content)
+                    return cached.content
+
+                if 200 <= r.status_code < 400:
+                    if cache:
+                        cache.misses += 1
+                        cache.store(self.url, language, r)
+                    if archive:
+                        archive.append(self.url, language, page_type, r.status_code, r.content)
+                    return r.content
+
+                Logger.warning(f"Request status code: {r.status_code} for {self.url}")
+
+            Logger.debug(f"Rate limit state for {self.transport.limiter.host(self.host).state()}")
+            if i < attempt_number:
+                nap(round(self.transport.limiter.backoff(i), 1), "making next request attempt")
 
-            Logger.log(f"Request status code: {r.status_code}")
+        raise HTTPError(f"Request still failing after {attempt_number} attempts")
 
-            nap(config['nap-request'], "making next request attempt")
+    def release(self):
+        """
+        Frees the parsed tree of the page, once everything needed was extracted from it.
+        If the soup is needed again, the page is fetched again
+        """
+        soup = self._soup
+        self._soup = None
+        self._prefetch = None
+        if soup is not None:
+            # the tree is full of reference cycles: it would be freed only on a full garbage collection
+            soup.decompose()
 
-        raise HTTPError(f"Request still failing after {attempt_number} attempts")
+    def evict(self):
+        """
+        Removes the page from the response cache, so that the next time it is needed it is requested again
+        """
+        cache = self.transport.cache
+        if cache:
+            cache.delete(self.url, self.transport.language)
 
     def content_error(self):
         """
-        When the page content required is not present, performs the logging if log setting is on
+        When the page content required is not present, performs the logging if log setting is on.
+        The page is removed from the cache: a retry requests it again instead of reading the same content
         """
         Logger.log()
-        Logger.log(f"Failed request for {self.url}")
+        Logger.error(f"Failed request for {self.url}")
         save_debug(self.soup.prettify())
+        self.evict()
         raise ValueError("Page was not loaded correctly")
 
 
+def pages_needed(items_wanted: int, items_per_page: int):
+    """
+    :param items_wanted:
+    items still wanted from a page and the ones that follow it, -1 for all of them
+    :return:
+    how many of the pages that follow the page are needed for the items wanted, if they hold as many items as it does,
+    or None if all of them are
+    """
+    if items_wanted < 0:
+        return None
+    if items_per_page <= 0 or items_wanted <= items_per_page:
+        return 0
+    return -(-(items_wanted - items_per_page) // items_per_page)
+
+
+class Prefetcher:
+    """
+    Fetches in the background the pages that follow the page being processed, up to depth pages ahead
+    """
+
+    def __init__(self, depth=1, asynchronous=False):
+        """
+        :param asynchronous:
+        if True, pages are prefetched in tasks of the running event loop, bounded by the fetch limits,
+        instead of in the prefetch threads
+        """
+        self.depth = depth
+        self.asynchronous = asynchronous
+        self.pages = {}
+        self.reached_parameters = set()
+        self.lock = threading.Lock()
+
+    def reached(self, page):
+        """
+        Registers the page as the one being processed
+        :return:
+        the page already prefetched for the same parameters, if any, otherwise the same page
+        """
+        if self.depth <= 0:
+            return page
+
+        with self.lock:
+            self.reached_parameters.add(page.parameters)
+            return self.pages.pop(page.parameters, page)
+
+    def follow(self, page, needed=None):
+        """
+        Starts prefetching the pages that follow the page.
+        The page itself is fetched first in this thread, if it was not prefetched
+        :param needed:
+        number of the following pages that will be used, if known: no more than them are prefetched
+        """
+        depth = self.depth if needed is None else min(self.depth, needed)
+        if depth > 0:
+            self._prefetch_next(page, depth)
+
+    def _prefetch_next(self, page, depth):
+        next_page = page.next_page()
+        if next_page is None:
+            return
+
+        with self.lock:
+            # the page might have been reached while its previous page was being fetched
+            if next_page.parameters in self.reached_parameters:
+                return
+            next_page = self.pages.setdefault(next_page.parameters, next_page)
+
+        def follow_next(future):
+            # a page that failed is not followed: its exception is raised when it is reached
+            if future.exception() is None:
+                self._prefetch_next(next_page, depth - 1)
+
+        future = next_page.prefetch_async() if self.asynchronous else next_page.prefetch()
+        if depth > 1:
+            future.add_done_callback(follow_next)
+
+
 class PaginatedPage(Page):
     """
     Class to model paginated pages:
@@ -73,24 +363,73 @@ class PaginatedPage(Page):
     """
     next_button_locator = None
 
-    def pages(self):
+    def next_page(self):
+        """
+        :return:
+        the page the next button points to, or None if this is the last page
+        """
+        next_button = self.soup.select_one(self.next_button_locator)
+        if next_button is None:
+            return None
+
+        return type(self)(self.base_url, parameters=next_button['href'], transport=self.transport)
+
+    def item_count(self):
+        """
+        :return:
+        number of items in the page, as items() would find them without a max
+        """
+        return len(self.soup.select(self.card_locator))
+
+    def pages(self, pages_needed=None):
         """
+        :param pages_needed:
+        function returning, for a page, how many of the pages that follow it will be used, so that no more than them
+        are prefetched. If None, pages are prefetched up to the prefetch depth
         :return:
         the next results page until there are no more pages
         """
         if not self.next_button_locator:
             raise AttributeError("PaginatedPage objects must have a next_button_locator attribute!")
 
+        prefetcher = Prefetcher(config['prefetch']['depth'])
+
         # the first page returned is the same page
-        yield self
+        page = self
+        while page is not None:
+            page = prefetcher.reached(page)
+            if prefetcher.depth > 0:
+                prefetcher.follow(page, pages_needed(page) if pages_needed else None)
+            try:
+                yield page
+                next_page = page.next_page()
+            finally:
+                # the items of the page were extracted: its tree is not needed anymore
+                page.release()
+            page = next_page
+
+    async def pages_async(self, pages_needed=None):
+        """
+        Async counterpart of pages()
+        """
+        if not self.next_button_locator:
+            raise AttributeError("PaginatedPage objects must have a next_button_locator attribute!")
 
-        next_button = self.soup.select_one(self.next_button_locator)
-        while next_button is not None:
-            nap(1, "getting next page")
-            next_page = type(self)(self.base_url, parameters=next_button['href'], headers=self.headers)
-            yield next_page
+        prefetcher = Prefetcher(config['prefetch']['depth'], asynchronous=True)
 
-            next_button = next_page.soup.select_one(self.next_button_locator)
+        page = self
+        while page is not None:
+            page = prefetcher.reached(page)
+            if prefetcher.depth > 0:
+                await page.soup_async()
+                prefetcher.follow(page, pages_needed(page) if pages_needed else None)
+            try:
+                yield page
+                await page.soup_async()
+                next_page = page.next_page()
+            finally:
+                page.release()
+            page = next_page
 
     @abstractmethod
     def items(self, max_items=-1, **kwargs):
@@ -108,22 +447,53 @@ class PaginatedPage(Page):
         items one by one
         """
         if max_items == 0:
-            Logger.log("no items required...")
+            Logger.debug("no items required...")
             return
 
         item_count = 0
         page_count = 0
-        for page in self.pages():
+        for page in self.pages(lambda page: pages_needed(max_items - item_count, page.item_count())):
             page_count += 1
 
+            for item in page.items(max_items - item_count, **kwargs):
+                yield item, page_count
+                item_count += 1
+
+            # checked before moving to the next page, so that it is not fetched
             if item_count == max_items:
-                Logger.log(f"Already collected max number of items: {max_items}")
+                Logger.debug(f"Already collected max number of items: {max_items}")
                 break
 
-            for item in page.items(max_items - item_count, **kwargs):
+
+    async def items_async(self, max_items=-1, **kwargs):
+        """
+        Async counterpart of items(), for pages whose items need no further requests
+        """
+        await self.soup_async()
+        for item in self.items(max_items, **kwargs):
+            yield item
+
+    async def items_to_end_async(self, max_items=-1, **kwargs):
+        """
+        Async counterpart of items_to_end()
+        """
+        if max_items == 0:
+            Logger.debug("no items required...")
+            return
+
+        item_count = 0
+        page_count = 0
+        async for page in self.pages_async(lambda page: pages_needed(max_items - item_count, page.item_count())):
+            page_count += 1
+
+            async for item in page.items_async(max_items - item_count, **kwargs):
                 yield item, page_count
                 item_count += 1
 
+            if item_count == max_items:
+                Logger.debug(f"Already collected max number of items: {max_items}")
+                break
+
 
 class ResultsPage(PaginatedPage):
     """
@@ -133,6 +503,15 @@ class ResultsPage(PaginatedPage):
     product_locator = "[data-component-type='s-search-result']"
     product_link_locator = "h2 a"
 
+    product_fields = CardFields(link=product_link_locator)
+
+    parse_only = SoupStrainer(lambda name, attrs: attrs.get('data-component-type') == 's-search-result'
+                              or has_class(attrs, 's-pagination-next'))
+
+    def item_count(self):
+        return len(self.soup.select(self.product_locator))
+
+    @timed_extraction
     def items(self, max_items=-1, **kwargs):
         products = self.soup.select(self.product_locator)
         if not products:
@@ -142,13 +521,13 @@ class ResultsPage(PaginatedPage):
         product_count = 0
         for product in products:
             if product_count == max_items:
-                Logger.log(f"Already collected max number of products: {max_items}")
+                Logger.debug(f"Already collected max number of products: {max_items}")
                 break
 
-            product_link = product.select_one(self.product_link_locator)
+            product_link = self.product_fields.extract(product)['link']
 
             if product_link:
-                yield ProductPage(self.base_url, product_link['href'], headers=self.headers)
+                yield ProductPage(self.base_url, product_link['href'], transport=self.transport)
                 product_count += 1
             else:
                 self.content_error()
@@ -162,27 +541,22 @@ class ProductPage(Page):
     name_locator = "#productTitle"
     ratings_count_locator = "#acrCustomerReviewText"
 
+    parse_only = SoupStrainer(id=['ASIN', 'productTitle', 'acrCustomerReviewText'])
+
     @staticmethod
-    def from_product_id(base_url: str, product_id: str, headers):
+    def from_product_id(base_url: str, product_id: str, transport: Transport):
         """
         :return:
         a new ProductPage object corresponding to the provided product id
         """
-        params = f"-/{headers['Accept-Language']}/dp/{product_id}/"
-        return ProductPage(base_url=base_url, parameters=params, headers=headers)
+        params = f"-/{transport.language}/dp/{product_id}/"
+        return ProductPage(base_url=base_url, parameters=params, transport=transport)
 
-    def product_questions(self, max_questions=-1, max_answers_per_question=-1):
+    def questions_page(self):
         """
-        :param max_questions:
-        maximum number of questions to be collected per product.
-        if -1, gets all questions available
-        :param max_answers_per_question:
-        maximum number of answers to be collected per question.
-        if -1, gets all answers available
         :return:
-        the first question page for this product
+        the first question page for this product, and the product data to be added to each of its questions
         """
-
         asin_soup = self.soup.select_one(self.asin_locator)
         name_soup = self.soup.select_one(self.name_locator)
         ratings_count_soup = self.soup.select_one(self.ratings_count_locator)
@@ -195,20 +569,45 @@ class ProductPage(Page):
         name = name_soup.text.strip()
         ratings_count_text = ratings_count_soup.text if ratings_count_soup else ""
 
-        match = re.search(r"\d+", ratings_count_text)
-        ratings_count = int(match.group()) if match else 0
+        product = {
+            'product_id': asin,
+            'product_name': name,
+            'product_ratings_count': number_from_text(ratings_count_text)
+        }
 
-        question_href = (f"-/{self.headers['Accept-Language']}"
-                         f"/ask/questions/asin/{asin}/ref=ask_dp_dpmw_ql_hza?isAnswered=true")
+        return QuestionsPage.from_product_id(self.base_url, asin, self.transport), product
 
-        questions_page = QuestionsPage(self.base_url, question_href, headers=self.headers)
+    def product_questions(self, max_questions=-1, max_answers_per_question=-1):
+        """
+        :param max_questions:
+        maximum number of questions to be collected per product.
+        if -1, gets all questions available
+        :param max_answers_per_question:
+        maximum number of answers to be collected per question.
+        if -1, gets all answers available
+        :return:
+        the questions of this product one by one
+        """
+        questions_page, product = self.questions_page()
+        self.release()
 
         for question, page_count in questions_page.items_to_end(max_questions,
                                                                 max_answers_per_question=max_answers_per_question):
+            question.product = product
 
-            question['product_id'] = asin
-            question['product_name'] = name
-            question['product_ratings_count'] = ratings_count
+            yield question
+
+    async def product_questions_async(self, max_questions=-1, max_answers_per_question=-1):
+        """
+        Async counterpart of product_questions()
+        """
+        await self.soup_async()
+        questions_page, product = self.questions_page()
+        self.release()
+
+        async for question, page_count in questions_page.items_to_end_async(
+                max_questions, max_answers_per_question=max_answers_per_question):
+            question.product = product
 
             yield question
 
@@ -223,26 +622,106 @@ class QuestionsPage(PaginatedPage):
     votes_locator = ".vote .count"
     question_locator = "[id^='question']"
     question_link_locator = "a"
+    answer_count_locator = ".askAnswerCount"
 
-    def items(self, max_items=-1, max_answers_per_question=-1):
+    card_fields = CardFields(question=question_locator,
+                             question_link=Field(question_link_locator, within='question'),
+                             votes=votes_locator,
+                             answer_count=answer_count_locator)
+
+    # product data shown in the questions page
+    product_name_locator = ".askProductDescription a"
+    product_ratings_count_locator = "#acrCustomerReviewText"
+
+    parse_only = SoupStrainer(lambda name, attrs: has_class(attrs, 'askTeaserQuestions', 'a-last',
+                                                            'askProductDescription')
+                              or attrs.get('id') == 'acrCustomerReviewText')
+
+    @staticmethod
+    def from_product_id(base_url: str, product_id: str, transport: Transport):
+        """
+        :return:
+        a new QuestionsPage object for the first questions page of the provided product id
+        """
+        params = (f"-/{transport.language}"
+                  f"/ask/questions/asin/{product_id}/ref=ask_dp_dpmw_ql_hza?isAnswered=true")
+        return QuestionsPage(base_url=base_url, parameters=params, transport=transport)
+
+    def product(self, product_id: str, metadata='questions'):
+        """
+        :param metadata:
+        'questions' to take the product name and ratings count from this page,
+        'off' to leave them empty without loading the page
+        :return:
+        the product data to be added to each of its questions
+        """
+        if metadata == 'off':
+            return {
+                'product_id': product_id,
+                'product_name': None,
+                'product_ratings_count': None
+            }
+
+        name_soup = self.soup.select_one(self.product_name_locator)
+        ratings_count_soup = self.soup.select_one(self.product_ratings_count_locator)
+
+        return {
+            'product_id': product_id,
+            'product_name': name_soup.text.strip() if name_soup else "",
+            'product_ratings_count': number_from_text(ratings_count_soup.text if ratings_count_soup else "")
+        }
+
+    def product_questions(self, product_id: str, max_questions=-1, max_answers_per_question=-1, metadata='questions'):
+        """
+        Same as ProductPage.product_questions, for the first questions page of the product,
+        without requesting the product page
+        :param metadata:
+        where the product data comes from, as in product()
+        """
+        product = None
+
+        for question, page_count in self.items_to_end(max_questions,
+                                                      max_answers_per_question=max_answers_per_question):
+            if product is None:
+                product = self.product(product_id, metadata)
+            question.product = product
+
+            yield question
+
+    async def product_questions_async(self, product_id: str, max_questions=-1, max_answers_per_question=-1,
+                                      metadata='questions'):
+        """
+        Async counterpart of product_questions()
+        """
+        product = None
+
+        async for question, page_count in self.items_to_end_async(
+                max_questions, max_answers_per_question=max_answers_per_question):
+            if product is None:
+                product = self.product(product_id, metadata)
+            question.product = product
+
+            yield question
+
+    @timed_extraction
+    def question_cards(self, max_items=-1):
         """
         :param max_items:
         maximum number of items to retrieve
         if -1, gets all items available
-        :param max_answers_per_question:
-        maximum number of answers to be collected per question.
-        if -1, gets all answers available
         :return:
-        questions one by one for the current page
+        (question, answers_page) for each question card of the current page.
+        The question still lacks the date and the answers, which come from its answers page
         """
         question_count = 0
         for card in self.soup.select(self.card_locator):
             if question_count == max_items:
-                Logger.log(f"Already collected max number of questions: {max_items}")
+                Logger.debug(f"Already collected max number of questions: {max_items}")
                 break
 
-            question_soup = card.select_one(self.question_locator)
-            question_link_soup = question_soup.select_one(self.question_link_locator)
+            fields = self.card_fields.extract(card)
+            question_soup = fields['question']
+            question_link_soup = fields['question_link']
 
             if not question_soup or not question_link_soup:
                 self.content_error()
@@ -250,23 +729,72 @@ class QuestionsPage(PaginatedPage):
 
             question_count += 1
 
-            votes_soup = card.select_one(self.votes_locator)
+            votes_soup = fields['votes']
             question_text = question_link_soup.text.strip()
             try:
                 votes_value = int(votes_soup.text)
             except (AttributeError, ValueError):
                 votes_value = 0
 
-            answers_page = AnswersPage(self.base_url, question_link_soup['href'], self.headers)
+            question = Question(id=question_soup['id'], question=question_text, votes=votes_value)
+
+            answers_page = AnswersPage(self.base_url, question_link_soup['href'], self.transport)
+            answer_count_soup = fields['answer_count']
+            if answer_count_soup:
+                answers_page.listed_answer_count = number_from_text(answer_count_soup.text)
+
+            yield question, answers_page
+
+    def items(self, max_items=-1, max_answers_per_question=-1):
+        """
+        :param max_items:
+        maximum number of items to retrieve
+        if -1, gets all items available
+        :param max_answers_per_question:
+        maximum number of answers to be collected per question.
+        if -1, gets all answers available
+        :return:
+        questions one by one for the current page
+        """
+        cards = list(self.question_cards(max_items))
+
+        def question_answers(answers_page):
+            # the date comes first: the answers page is released once its answers are extracted
+            date = answers_page.question_date()
             answers = [a for a, page_count in answers_page.items_to_end(max_answers_per_question)]
+            return answers, date
 
-            question = {
-                "id": question_soup['id'],
-                "question": question_text,
-                "votes": votes_value,
-                "date": answers_page.question_date(),
-                "answers": answers
-            }
+        # answers pages of all the questions are fetched at once, and map keeps the questions order
+        with ThreadPoolExecutor(max_workers=config['concurrency']['answers']) as pool:
+            for (question, answers_page), (answers, date) in zip(cards, pool.map(question_answers,
+                                                                                 [a for q, a in cards])):
+                question.date = date
+                question.answers = answers
+
+                yield question
+
+    async def items_async(self, max_items=-1, max_answers_per_question=-1):
+        """
+        Async counterpart of items()
+        """
+        import asyncio
+
+        await self.soup_async()
+        cards = list(self.question_cards(max_items))
+        answers_limit = asyncio.Semaphore(config['concurrency']['answers'])
+
+        async def question_answers(answers_page):
+            async with answers_limit:
+                # the date comes first: the answers page is released once its answers are extracted
+                await answers_page.soup_async()
+                date = answers_page.question_date()
+                answers = [a async for a, page_count in answers_page.items_to_end_async(max_answers_per_question)]
+                return answers, date
+
+        results = await asyncio.gather(*[question_answers(answers_page) for question, answers_page in cards])
+        for (question, answers_page), (answers, date) in zip(cards, results):
+            question.date = date
+            question.answers = answers
 
             yield question
 
@@ -285,8 +813,18 @@ class AnswersPage(PaginatedPage):
     badge_locator = ".askNewAuthorBadge"
     votes_locator = ".askVoteAnswerTextWithCount"
 
+    card_fields = CardFields(text=text_locator, date=date_locator, badge=badge_locator, votes=votes_locator)
+    votes_pattern = re.compile(r".*?(?P<upvotes>\d+).*? .*?(?P<allvotes>\d+).*?")
+
+    # number of answers shown in the question card that links to this page, if any
+    listed_answer_count = None
+
+    # the question date is located by its sibling, so their common parent must be kept: the whole page is parsed
+    parse_only = None
+
     def date_string_from_soup(self, soup, date_format="%Y/%m/%d"):
-        date = search_dates(soup.text, languages=[self.headers['Accept-Language']])[0][1] if soup else None
+        with metrics.timer('dates', page=type(self).__name__):
+            date = find_date(soup.text, self.transport.language) if soup else None
         return date.strftime(date_format) if date else ""
 
     def question_date(self):
@@ -298,23 +836,25 @@ class AnswersPage(PaginatedPage):
 
         return self.date_string_from_soup(question_date_soup)
 
+    @timed_extraction
     def items(self, max_items=-1, **kwargs):
         answer_count = 0
         for card in self.soup.select(self.card_locator):
             if answer_count == max_items:
-                Logger.log(f"Already collected max number of answers: {max_items}")
+                Logger.debug(f"Already collected max number of answers: {max_items}")
                 break
 
-            answer_soup = card.select_one(self.text_locator)
+            fields = self.card_fields.extract(card)
+            answer_soup = fields['text']
             if not answer_soup:
                 self.content_error()
                 continue
 
             answer_count += 1
 
-            date_soup = card.select_one(self.date_locator)
-            badge_soup = card.select_one(self.badge_locator)
-            votes_soup = card.select_one(self.votes_locator)
+            date_soup = fields['date']
+            badge_soup = fields['badge']
+            votes_soup = fields['votes']
 
             answer_text = answer_soup.text.strip()
             date_text = self.date_string_from_soup(date_soup)
@@ -326,23 +866,13 @@ class AnswersPage(PaginatedPage):
             upvotes = 0
             downvotes = 0
             if votes_soup:
-                match = re.search(r".*?(?P<upvotes>\d+).*? .*?(?P<allvotes>\d+).*?", votes_soup.text)
+                match = self.votes_pattern.search(votes_soup.text)
                 if match:
                     votes = match.groupdict()
                     upvotes = int(votes['upvotes'])
                     downvotes = int(votes['allvotes']) - upvotes
 
-            answer = {
-                "id": card['id'],
-                "url": self.url,
-                "answer": answer_text,
-                "badge_text": badge_text,
-                "is_manufacturer": is_manufacturer,
-                "is_seller": is_seller,
-                "date": date_text,
-                "upvotes": upvotes,
-                "downvotes": downvotes
-            }
-
-            yield answer
+            yield Answer(id=card['id'], url=self.url, answer=answer_text, badge_text=badge_text,
+                         is_manufacturer=is_manufacturer, is_seller=is_seller, date=date_text,
+                         upvotes=upvotes, downvotes=downvotes)
 
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+import os
+import threading
+import traceback
+
+from config import config
+from log import Logger
+from metrics import metrics
+from page import Page, ProductPage, QuestionsPage, AnswersPage
+from transport import Transport
+from utils import process_pool
+
+# transports for the pages built in the parse processes, that never make requests: one per language
+_offline_transports = {}
+
+
+def extract(page_type, base_url: str, parameters: str, language: str, content: bytes, max_items=-1,
+            product_id=None, metadata='questions'):
+    """
+    Runs in a parse process: builds the page from its content, and extracts what the pipeline needs from it
+    :return:
+    for a ProductPage, the product data and the parameters of its first questions page.
+    For a QuestionsPage, (question, answers page parameters) for each question, the next page parameters,
+    and the product data if product_id is provided.
+    For an AnswersPage, the answers, the question date, and the next page parameters
+    """
+    if language not in _offline_transports:
+        _offline_transports[language] = Transport({'Accept-Language': language})
+
+    page = page_type(base_url, parameters, _offline_transports[language])
+    page.parse(content)
+
+    if page_type is ProductPage:
+        questions_page, product = page.questions_page()
+        return product, questions_page.parameters
+
+    next_page = page.next_page()
+    next_parameters = next_page.parameters if next_page else None
+
+    if page_type is QuestionsPage:
+        cards = [(question, answers_page.parameters) for question, answers_page in page.question_cards(max_items)]
+        product = page.product(product_id, metadata) if product_id else None
+        return cards, next_parameters, product
+
+    return list(page.items(max_items)), page.question_date(), next_parameters
+
+
+class Pipeline:
+    """
+    Scraps products in two stages: I/O threads fetch the raw pages,
+    and a pool of processes parses them and extracts the questions and answers.
+    Bounded queues between the stages keep each one from running too far ahead of the next
+    """
+
+    def __init__(self, fetch_workers=8, parse_workers=None, queue_size=32):
+        """
+        :param fetch_workers:
+        number of threads fetching pages, each one working on a product at a time
+        :param parse_workers:
+        number of processes parsing pages. If None, one per core
+        :param queue_size:
+        max number of pages waiting to be parsed, and of products waiting to be saved
+        """
+        self.fetch_workers = fetch_workers
+        self.parse_pool = process_pool(parse_workers or os.cpu_count())
+        self.parse_slots = threading.Semaphore(queue_size)
+        self.done = Queue(maxsize=queue_size)
+
+    @staticmethod
+    def from_config():
+        """
+        :return:
+        a new Pipeline with the settings from the config file
+        """
+        settings = config['pipeline']
+        return Pipeline(settings['fetch-workers'], settings['parse-workers'], settings['queue-size'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.parse_pool.shutdown(cancel_futures=True)
+
+    def fetch_and_extract(self, page: Page, max_items=-1, **kwargs):
+        """
+        Fetches the page in this thread, and waits for a parse process to extract it
+        """
+        content = page.fetch()
+        with self.parse_slots, metrics.timer('parse-process', page=type(page).__name__):
+            future = self.parse_pool.submit(extract, type(page), page.base_url, page.parameters,
+                                            page.transport.language, content, max_items, **kwargs)
+            try:
+                return future.result()
+            except Exception:
+                # the parse process has no cache: the content it could not extract is removed from it here
+                page.evict()
+                raise
+
+    def product_questions(self, page: Page, max_questions=-1, max_answers_per_question=-1,
+                          product_id=None, metadata='product'):
+        """
+        Same as ProductPage.product_questions, parsing every page in the process pool
+        :param page:
+        the product page or, if metadata is not 'product', the first questions page of the product
+        :param metadata:
+        where the product data comes from: 'product', or as in QuestionsPage.product()
+        :return:
+        the questions of the product one by one
+        """
+        base_url = page.base_url
+        transport = page.transport
+        if metadata == 'product':
+            product, parameters = self.fetch_and_extract(page)
+        else:
+            product, parameters = None, page.parameters
+
+        question_count = 0
+        while parameters and question_count != max_questions:
+            cards, parameters, page_product = self.fetch_and_extract(
+                QuestionsPage(base_url, parameters, transport),
+                max_questions - question_count if max_questions >= 0 else -1,
+                product_id=product_id if product is None else None, metadata=metadata)
+            product = product or page_product
+
+            # answers pages of all the questions are fetched at once, and map keeps the questions order
+            answers_pages = [AnswersPage(base_url, answers_parameters, transport) for _, answers_parameters in cards]
+            with ThreadPoolExecutor(max_workers=config['concurrency']['answers']) as pool:
+                results = pool.map(lambda page: self.question_answers(page, max_answers_per_question), answers_pages)
+
+                for (question, _), (answers, question_date) in zip(cards, results):
+                    question.date = question_date
+                    question.answers = answers
+                    question.product = product
+                    question_count += 1
+
+                    yield question
+
+    def question_answers(self, answers_page: AnswersPage, max_answers_per_question=-1):
+        """
+        :return:
+        the answers of the question, navigating its answers pages, and the question date
+        """
+        answers = []
+        question_date = None
+        page = answers_page
+        while page is not None:
+            page_answers, date, parameters = self.fetch_and_extract(
+                page, max_answers_per_question - len(answers) if max_answers_per_question >= 0 else -1)
+
+            question_date = date if question_date is None else question_date
+            answers += page_answers
+            if len(answers) == max_answers_per_question or not parameters:
+                break
+
+            page = AnswersPage(page.base_url, parameters, page.transport)
+
+        return answers, question_date
+
+    def scrap(self, product_pages, max_questions=-1, max_answers_per_question=-1, metadata='product', on_done=None):
+        """
+        :param product_pages:
+        iterator of (product_id, page), shared by the fetch threads. The page is the first one for the product,
+        as in product_questions()
+        :param on_done:
+        if set, called as on_done(product_id, exception) in the fetch thread as soon as a product is done,
+        before the thread takes the next one
+        :return:
+        (product_id, questions, exception) for each product as soon as it is done, in no particular order.
+        If the product failed, questions holds the ones fetched before the exception
+        """
+        lock = threading.Lock()
+
+        def next_product():
+            with lock:
+                return next(product_pages, None)
+
+        def fetch_worker():
+            try:
+                while (item := next_product()) is not None:
+                    product_id, product_page = item
+                    questions = []
+                    exception = None
+                    try:
+                        for question in self.product_questions(product_page, max_questions, max_answers_per_question,
+                                                               product_id, metadata):
+                            questions.append(question)
+                    except Exception as e:
+                        Logger.error(traceback.format_exc())
+                        exception = e
+
+                    self.done.put((product_id, questions, exception))
+                    if on_done is not None:
+                        on_done(product_id, exception)
+            finally:
+                self.done.put(None)
+
+        workers = [threading.Thread(target=fetch_worker, daemon=True) for _ in range(self.fetch_workers)]
+        for worker in workers:
+            worker.start()
+
+        running = len(workers)
+        while running:
+            result = self.done.get()
+            if result is None:
+                running -= 1
+            else:
+                yield result
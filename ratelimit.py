@@ -0,0 +1,295 @@
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import random
+import threading
+import time
+
+from config import config
+from log import Logger
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second, with bursts of up to `capacity` requests
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, even if it is not available yet
+        :return:
+        seconds to wait until the token taken is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    Opens when most of the recent requests to a host failed (429, 5xx or no response), pausing all of them at once
+    instead of every worker retrying on its own. Once the pause is over, the next response decides:
+    a failure opens the circuit again for twice as long, up to open_max_seconds, and a success closes it
+    """
+
+    def __init__(self, window=20, error_rate=0.5, open_seconds=30, open_max_seconds=600):
+        """
+        :param window:
+        number of recent responses the error rate is measured on
+        :param error_rate:
+        fraction of failed responses in the window that opens the circuit
+        """
+        self.recent = deque(maxlen=window)
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.open_max_seconds = open_max_seconds
+        # seconds of the last pause while the circuit is open, 0 when it is closed
+        self.opened_for = 0
+        self.open_until = 0
+
+    def record(self, failed: bool) -> float:
+        """
+        Registers the outcome of a request
+        :return:
+        seconds all the requests to the host must pause, 0 if the circuit stays closed
+        """
+        now = time.monotonic()
+
+        if self.opened_for:
+            if now < self.open_until:
+                # a request already in flight when the circuit opened
+                return 0
+            if failed:
+                self.opened_for = min(self.open_max_seconds, self.opened_for * 2)
+                self.open_until = now + self.opened_for
+                return self.opened_for
+            self.opened_for = 0
+            self.recent.clear()
+            return 0
+
+        self.recent.append(failed)
+        if len(self.recent) == self.recent.maxlen and sum(self.recent) >= self.error_rate * len(self.recent):
+            self.opened_for = self.open_seconds
+            self.open_until = now + self.opened_for
+            return self.opened_for
+        return 0
+
+    @property
+    def is_open(self):
+        return self.opened_for > 0
+
+
+def failed_status(status_code: int):
+    return status_code == 429 or status_code >= 500
+
+
+class HostLimiter:
+    """
+    Rate limit for one host.
+    The rate goes down on every 429 or 503 response, and goes up after a window of healthy responses
+    """
+
+    def __init__(self, host: str, rate=1.0, min_rate=0.1, max_rate=5.0, burst=3, window=20,
+                 increase=0.2, decrease=0.5, breaker: CircuitBreaker = None):
+        """
+        :param breaker:
+        circuit breaker of the host. If None, requests are never paused for errors
+        """
+        self.host = host
+        self.breaker = breaker
+        self.bucket = TokenBucket(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.recent = deque(maxlen=window)
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self) -> float:
+        """
+        Waits until a request to the host is allowed
+        :return:
+        seconds waited
+        """
+        with self.lock:
+            wait = max(self.bucket.reserve(), self.blocked_until - time.monotonic())
+
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0)
+
+    def record(self, status_code: int, retry_after: float = None):
+        """
+        Registers the response status, adapting the rate to it
+        :param retry_after:
+        seconds the host asked to wait before the next request, if any
+        """
+        with self.lock:
+            self.recent.append(status_code)
+
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+                Logger.warning(f"{self.host} asked to retry after {retry_after:.0f} seconds")
+
+            if status_code in (429, 503):
+                self._set_rate(self.rate * self.decrease)
+                self.recent.clear()
+            elif len(self.recent) == self.recent.maxlen and all(200 <= s < 300 for s in self.recent):
+                self._set_rate(self.rate + self.increase)
+                self.recent.clear()
+
+            self._record_outcome(failed_status(status_code))
+
+    def record_error(self):
+        """
+        Registers a request that got no response
+        """
+        with self.lock:
+            self._record_outcome(True)
+
+    def _record_outcome(self, failed: bool):
+        if self.breaker is None:
+            return
+
+        pause = self.breaker.record(failed)
+        if pause:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            Logger.warning(f"Too many failed requests to {self.host}: pausing all of them for {pause:.0f} seconds")
+
+    def _set_rate(self, rate):
+        rate = min(self.max_rate, max(self.min_rate, rate))
+        if rate != self.rate:
+            Logger.log(f"Rate limit for {self.host}: {self.rate:.2f} -> {rate:.2f} requests per second")
+            self.bucket.rate = rate
+
+    def state(self):
+        """
+        :return:
+        a one line summary of the limiter state
+        """
+        with self.lock:
+            statuses = list(self.recent)
+            blocked = max(0, self.blocked_until - time.monotonic())
+
+        ok = sum(200 <= s < 300 for s in statuses)
+        throttled = sum(s in (429, 503) for s in statuses)
+        return (f"{self.host}: {self.rate:.2f} requests per second"
+                f", {ok} ok / {throttled} throttled of last {len(statuses)} responses"
+                f"{f', blocked for {blocked:.0f} seconds' if blocked else ''}"
+                f"{', circuit open' if self.breaker and self.breaker.is_open else ''}")
+
+
+class RateLimiter:
+    """
+    Rate limits per host, plus the backoff between attempts of a failing request
+    """
+
+    def __init__(self, backoff_base=2.0, backoff_max=120.0, breaker_settings: dict = None, **host_settings):
+        """
+        :param backoff_base:
+        seconds to wait after the first failed attempt, doubled on each following attempt
+        :param backoff_max:
+        max seconds to wait between attempts
+        :param breaker_settings:
+        CircuitBreaker parameters used for every host. If None, hosts have no circuit breaker
+        :param host_settings:
+        HostLimiter parameters used for every host
+        """
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_settings = breaker_settings
+        self.host_settings = host_settings
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_config():
+        """
+        :return:
+        a new RateLimiter with the settings from the config file
+        """
+        settings = config['rate-limit']
+        breaker = config['circuit-breaker']
+        breaker_settings = None
+        if breaker['enabled']:
+            breaker_settings = dict(window=breaker['window'],
+                                    error_rate=breaker['error-rate'],
+                                    open_seconds=breaker['open-seconds'],
+                                    open_max_seconds=breaker['open-max-seconds'])
+        return RateLimiter(backoff_base=settings['backoff-base'],
+                           backoff_max=settings['backoff-max'],
+                           breaker_settings=breaker_settings,
+                           rate=settings['initial-rate'],
+                           min_rate=settings['min-rate'],
+                           max_rate=settings['max-rate'],
+                           burst=settings['burst'],
+                           window=settings['window'],
+                           increase=settings['increase'],
+                           decrease=settings['decrease'])
+
+    def host(self, host: str) -> HostLimiter:
+        with self.lock:
+            if host not in self.hosts:
+                breaker = CircuitBreaker(**self.breaker_settings) if self.breaker_settings else None
+                self.hosts[host] = HostLimiter(host, breaker=breaker, **self.host_settings)
+            return self.hosts[host]
+
+    def acquire(self, host: str) -> float:
+        return self.host(host).acquire()
+
+    def record(self, host: str, status_code: int, headers=None):
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        self.host(host).record(status_code, retry_after)
+
+    def record_error(self, host: str):
+        self.host(host).record_error()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        :return:
+        seconds to wait after the attempt failed: exponential backoff with full jitter
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def log_state(self):
+        for host in list(self.hosts.values()):
+            Logger.log(f"Rate limit state for {host.state()}")
+
+
+def parse_retry_after(value):
+    """
+    :return:
+    seconds to wait from a Retry-After header value, given either in seconds or as a date
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        # dates in -0000 have no time zone, and HTTP dates are in UTC
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
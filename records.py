@@ -0,0 +1,61 @@
+class Answer:
+    """
+    An answer to a question. Slotted, as a crawl keeps many of them in memory
+    """
+    __slots__ = ('id', 'url', 'answer', 'badge_text', 'is_manufacturer', 'is_seller', 'date', 'upvotes', 'downvotes')
+
+    def __init__(self, id: str, url: str, answer: str, badge_text: str, is_manufacturer: bool, is_seller: bool,
+                 date: str, upvotes: int, downvotes: int):
+        self.id = id
+        self.url = url
+        self.answer = answer
+        self.badge_text = badge_text
+        self.is_manufacturer = is_manufacturer
+        self.is_seller = is_seller
+        self.date = date
+        self.upvotes = upvotes
+        self.downvotes = downvotes
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Question:
+    """
+    A question, with its answers and a reference to the data of its product, shared by all the product questions
+    """
+    __slots__ = ('id', 'question', 'votes', 'date', 'answers', 'product')
+
+    def __init__(self, id: str, question: str, votes: int, date: str = None, answers: list = None,
+                 product: dict = None):
+        self.id = id
+        self.question = question
+        self.votes = votes
+        self.date = date
+        self.answers = answers
+        self.product = product
+
+    def to_dict(self):
+        """
+        :return:
+        the question in the output JSON shape, with the product data after the answers
+        """
+        record = {
+            'id': self.id,
+            'question': self.question,
+            'votes': self.votes,
+            'date': self.date,
+            'answers': [answer.to_dict() for answer in self.answers or ()],
+        }
+        if self.product:
+            record.update(self.product)
+        return record
+
+
+def to_json_value(record):
+    """
+    default function for json.dumps, to serialise the records in their output JSON shape
+    """
+    if isinstance(record, (Question, Answer)):
+        return record.to_dict()
+    raise TypeError(f"Object of type {type(record).__name__} is not JSON serializable")
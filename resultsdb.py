@@ -0,0 +1,241 @@
+from pathlib import Path
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+from config import config
+from log import Logger
+from records import Answer, Question
+
+PRODUCT_KEYS = ('product_id', 'product_name', 'product_ratings_count')
+ANSWER_KEYS = Answer.__slots__
+
+
+class ResultsDatabase:
+    """
+    Questions and answers of every crawl in one SQLite database, keyed on product id (ASIN), question id and
+    answer id, so that runs, shards and incremental deltas add up to one dataset without duplicates.
+    Records are buffered and upserted in batches, each batch in a single transaction
+    """
+
+    def __init__(self, path="results.sqlite", batch_size=500):
+        """
+        :param path:
+        database file for the results
+        :param batch_size:
+        questions buffered before they are written. The buffer is also written on flush(), e.g. after each product
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.count = 0
+
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS products ("
+                        " product_id TEXT PRIMARY KEY, product_name TEXT, product_ratings_count INTEGER,"
+                        " updated_at REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS questions ("
+                        " question_id TEXT PRIMARY KEY, product_id TEXT, question TEXT, votes INTEGER, date TEXT,"
+                        " updated_at REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS answers ("
+                        " answer_id TEXT PRIMARY KEY, question_id TEXT, url TEXT, answer TEXT, badge_text TEXT,"
+                        " is_manufacturer INTEGER, is_seller INTEGER, date TEXT, upvotes INTEGER, downvotes INTEGER,"
+                        " updated_at REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS questions_product ON questions (product_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS questions_date ON questions (date)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS answers_question ON answers (question_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS answers_date ON answers (date)")
+        self.db.commit()
+
+    @staticmethod
+    def from_config():
+        """
+        :return:
+        a new ResultsDatabase with the settings from the config file, or None if it is disabled
+        """
+        settings = config['results-db']
+        if not settings['enabled']:
+            return None
+        return ResultsDatabase(settings['path'], settings['batch-size'])
+
+    def write(self, question):
+        """
+        Adds a question, as a Question record or in the output JSON shape, to be written with the next batch
+        """
+        with self.lock:
+            self.pending.append(question.to_dict() if isinstance(question, Question) else question)
+            if len(self.pending) >= self.batch_size:
+                self._write_pending()
+
+    def flush(self):
+        """
+        Writes the questions buffered
+        """
+        with self.lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        if not self.pending:
+            return
+
+        now = time.time()
+        products = {}
+        questions = []
+        answers = []
+        for record in self.pending:
+            product_id = record.get('product_id')
+            if product_id is not None:
+                products[product_id] = (product_id, record.get('product_name'), record.get('product_ratings_count'),
+                                        now)
+            questions.append((record['id'], product_id, record['question'], record['votes'], record['date'], now))
+            answers += [(answer['id'], record['id'], *(answer[key] for key in ANSWER_KEYS[1:]), now)
+                        for answer in record.get('answers') or ()]
+
+        with self.db:
+            # product data left empty (product metadata off) does not overwrite the one known
+            self.db.executemany("INSERT INTO products VALUES (?, ?, ?, ?) ON CONFLICT (product_id) DO UPDATE SET"
+                                " product_name = COALESCE(excluded.product_name, product_name),"
+                                " product_ratings_count = COALESCE(excluded.product_ratings_count,"
+                                " product_ratings_count), updated_at = excluded.updated_at",
+                                products.values())
+            self.db.executemany("INSERT INTO questions VALUES (?, ?, ?, ?, ?, ?)"
+                                " ON CONFLICT (question_id) DO UPDATE SET"
+                                " product_id = COALESCE(excluded.product_id, product_id), question = excluded.question,"
+                                " votes = excluded.votes, date = COALESCE(excluded.date, date),"
+                                " updated_at = excluded.updated_at",
+                                questions)
+            self.db.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                                " ON CONFLICT (answer_id) DO UPDATE SET question_id = excluded.question_id,"
+                                " url = excluded.url, answer = excluded.answer, badge_text = excluded.badge_text,"
+                                " is_manufacturer = excluded.is_manufacturer, is_seller = excluded.is_seller,"
+                                " date = excluded.date, upvotes = excluded.upvotes, downvotes = excluded.downvotes,"
+                                " updated_at = excluded.updated_at",
+                                answers)
+
+        self.count += len(self.pending)
+        self.pending = []
+
+    def product_ids(self):
+        """
+        :return:
+        the ids of the products with questions, in the order they were first saved
+        """
+        return [row[0] for row in self.db.execute("SELECT product_id FROM questions WHERE product_id IS NOT NULL"
+                                                  " GROUP BY product_id ORDER BY MIN(rowid)")]
+
+    def questions(self, product_ids=None):
+        """
+        :param product_ids:
+        if set, only the questions of these products
+        :return:
+        the questions in the output JSON shape, one by one, in the order they were first saved
+        """
+        self.flush()
+
+        query = ("SELECT q.question_id, q.question, q.votes, q.date, q.product_id, p.product_name,"
+                 " p.product_ratings_count FROM questions q LEFT JOIN products p ON p.product_id = q.product_id")
+        if product_ids is None:
+            rows = self.db.execute(f"{query} ORDER BY q.rowid")
+        else:
+            product_ids = list(product_ids)
+            rows = self.db.execute(f"{query} WHERE q.product_id IN ({', '.join('?' * len(product_ids))})"
+                                   f" ORDER BY q.rowid", product_ids)
+
+        for question_id, question, votes, date, product_id, product_name, ratings_count in rows.fetchall():
+            answers = []
+            for row in self.db.execute(f"SELECT answer_id, {', '.join(ANSWER_KEYS[1:])} FROM answers"
+                                       f" WHERE question_id = ? ORDER BY rowid", (question_id,)):
+                answer = dict(zip(ANSWER_KEYS, row))
+                # SQLite keeps booleans as integers
+                answer['is_manufacturer'] = bool(answer['is_manufacturer'])
+                answer['is_seller'] = bool(answer['is_seller'])
+                answers.append(answer)
+
+            record = {'id': question_id, 'question': question, 'votes': votes, 'date': date, 'answers': answers}
+            if product_id is not None:
+                record.update(zip(PRODUCT_KEYS, (product_id, product_name, ratings_count)))
+            yield record
+
+    def export(self, file_name: str, product_ids=None):
+        """
+        Saves the questions as one JSON array, the same as the output files of a crawl
+        :param file_name:
+        name of the file, without extension
+        :return:
+        the path of the file
+        """
+        path = f"{file_name}.json"
+        count = 0
+        with open(path, 'w', encoding="utf-8") as f:
+            f.write("[")
+            for count, question in enumerate(self.questions(product_ids), 1):
+                # same separators as json.dumps of the whole list
+                f.write((", " if count > 1 else "") + json.dumps(question))
+            f.write("]")
+
+        Logger.log(f"Exported {count} questions to '{path}'")
+        return path
+
+    def export_products(self, directory: str, product_ids=None):
+        """
+        Saves the questions of each product in a file named after the product id, as when scrapping by product id
+        """
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for product_id in product_ids or self.product_ids():
+            self.export(str(Path(directory) / product_id), [product_id])
+
+    def close(self):
+        self.flush()
+        if self.count:
+            Logger.log(f"Saved {self.count} questions in the results database '{self.path}'")
+        self.db.close()
+
+
+def load(database: ResultsDatabase, paths):
+    """
+    Adds the questions of output files, JSON arrays or JSON Lines, to the database
+    :param paths:
+    output files, or directories with output files
+    """
+    from shard import output_files, questions_from
+
+    files = output_files(paths)
+    for file in files:
+        for question in questions_from(file):
+            database.write(question)
+    database.flush()
+    Logger.log(f"Loaded {len(files)} files into '{database.path}'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Loads output files into the results database, and exports it as JSON")
+    parser.add_argument("database", help="Results database file, e.g. results.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load_parser = commands.add_parser("load", help="Adds the questions of output files to the database")
+    load_parser.add_argument("paths", nargs='+', help="Output files, or directories with output files")
+
+    export_parser = commands.add_parser("export", help="Saves the questions as one JSON array")
+    export_parser.add_argument("output", help="Name of the JSON file, without extension")
+    export_parser.add_argument("--product", dest="product_ids", action='append', metavar="PRODUCT_ID",
+                               help="Exports only the questions of the product, can be repeated")
+
+    products_parser = commands.add_parser("export-products", help="Saves the questions of each product in a file")
+    products_parser.add_argument("directory", help="Directory for the files, named <product_id>.json")
+    products_parser.add_argument("--product", dest="product_ids", action='append', metavar="PRODUCT_ID",
+                                 help="Exports only the product, can be repeated")
+    args = parser.parse_args()
+
+    results = ResultsDatabase(args.database)
+    if args.command == 'load':
+        load(results, args.paths)
+    elif args.command == 'export':
+        results.export(args.output, args.product_ids)
+    else:
+        results.export_products(args.directory, args.product_ids)
+    results.close()
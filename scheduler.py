@@ -0,0 +1,136 @@
+import time
+
+from config import config
+from log import Logger
+from metrics import metrics
+from page import ProductPage, QuestionsPage
+from transport import Transport
+
+
+class Budget:
+    """
+    Time and number of requests a run may use. Requests are counted from when the budget is created,
+    including retries
+    """
+
+    def __init__(self, minutes=0, requests=0):
+        """
+        :param minutes:
+        minutes the run may take, 0 for no limit
+        :param requests:
+        requests the run may make, 0 for no limit
+        """
+        self.minutes = minutes
+        self.requests = requests
+        self.started_at = time.monotonic()
+        self.requests_before = metrics.total('requests')
+
+    @staticmethod
+    def from_config():
+        settings = config['scheduler']
+        return Budget(settings['max-minutes'], settings['max-requests'])
+
+    def requests_made(self):
+        return metrics.total('requests') - self.requests_before
+
+    def minutes_used(self):
+        return (time.monotonic() - self.started_at) / 60
+
+    def exhausted(self):
+        return ((self.minutes and self.minutes_used() >= self.minutes)
+                or (self.requests and self.requests_made() >= self.requests))
+
+    def __str__(self):
+        return (f"{self.minutes_used():.1f} of {self.minutes or 'unlimited'} minutes,"
+                f" {self.requests_made()} of {self.requests or 'unlimited'} requests")
+
+
+class ProductChunk:
+    """
+    Part of the questions of a product: up to a number of questions pages, from where the previous chunk stopped.
+    When the chunk stops before the last questions page, the product continues from its cursor in another chunk
+    """
+
+    def __init__(self, base_url: str, transport: Transport, product_id: str, cursor: dict = None,
+                 metadata='product'):
+        """
+        :param cursor:
+        where the previous chunk stopped, as returned by next_cursor(). If None, the product starts from the beginning
+        :param metadata:
+        where the product data comes from: 'product', or as in QuestionsPage.product()
+        """
+        cursor = cursor or {}
+        self.base_url = base_url
+        self.transport = transport
+        self.product_id = product_id
+        self.metadata = metadata
+        self.parameters = cursor.get('parameters')
+        self.product = cursor.get('product')
+        self.number = cursor.get('chunk', 0) + 1
+        self.question_count = cursor.get('questions', 0)
+        self.next_parameters = None
+
+    def first_questions_page(self):
+        if self.parameters:
+            return QuestionsPage(self.base_url, self.parameters, self.transport)
+
+        if self.metadata == 'product':
+            product_page = ProductPage.from_product_id(self.base_url, self.product_id, self.transport)
+            questions_page, self.product = product_page.questions_page()
+            product_page.release()
+            return questions_page
+
+        return QuestionsPage.from_product_id(self.base_url, self.product_id, self.transport)
+
+    def questions(self, max_pages: int, budget: Budget, max_questions=-1, max_answers_per_question=-1):
+        """
+        :param max_pages:
+        questions pages in the chunk
+        :param budget:
+        when it is exhausted, the chunk stops after the current questions page
+        :param max_questions:
+        max questions of the product, in all its chunks
+        :return:
+        the questions of the chunk one by one
+        """
+        if self.question_count == max_questions:
+            return
+
+        page_count = 0
+        # pages past the chunk are not prefetched: the page reached is the (page_count + 1)th one
+        pages = self.first_questions_page().pages(
+            lambda page: 0 if budget.exhausted() else max_pages - page_count - 1)
+
+        for page in pages:
+            page_count += 1
+            if self.product is None:
+                self.product = page.product(self.product_id, self.metadata)
+
+            remaining = max_questions - self.question_count if max_questions >= 0 else -1
+            for question in page.items(remaining, max_answers_per_question=max_answers_per_question):
+                question.product = self.product
+                self.question_count += 1
+
+                yield question
+
+            if self.question_count == max_questions:
+                Logger.debug(f"Already collected max number of questions: {max_questions}")
+                return
+
+            if page_count >= max_pages or budget.exhausted():
+                # the next chunk starts at the page that follows, without fetching it
+                next_page = page.next_page()
+                self.next_parameters = next_page.parameters if next_page else None
+                return
+
+    @property
+    def finished(self):
+        return self.next_parameters is None
+
+    def next_cursor(self):
+        """
+        :return:
+        where the next chunk of the product starts, to be saved between runs
+        """
+        return {'parameters': self.next_parameters, 'product': self.product, 'chunk': self.number,
+                'questions': self.question_count}
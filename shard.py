@@ -0,0 +1,134 @@
+from pathlib import Path
+
+import argparse
+import hashlib
+import json
+
+from log import Logger
+from writer import EXTENSIONS, RecordWriter, read_records, to_json
+
+
+class Shard:
+    """
+    One of count disjoint parts of the products, for crawls split across several nodes.
+    Products are assigned by a stable hash of their id, so every node agrees without coordination
+    """
+
+    def __init__(self, index: int, count: int):
+        """
+        :param index:
+        number of this shard, from 1 to count
+        """
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Shard {index}/{count} does not exist: it must be between 1/{count} and {count}/{count}")
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def parse(text: str):
+        """
+        :param text:
+        the shard as i/N, e.g. 2/4
+        """
+        try:
+            index, count = (int(part) for part in text.split('/'))
+        except ValueError:
+            raise ValueError(f"Shard '{text}' must be i/N, e.g. 2/4")
+        return Shard(index, count)
+
+    def owns(self, product_id: str):
+        digest = hashlib.blake2b(product_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.count == self.index - 1
+
+    @property
+    def name(self):
+        """
+        :return:
+        suffix for the files of this shard, e.g. shard2of4
+        """
+        return f"shard{self.index}of{self.count}"
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+def output_files(paths):
+    """
+    :return:
+    the output files in the paths: files as they are, and the JSON and JSON Lines files in directories
+    """
+    patterns = ["*.json", "*.jsonl"] + [f"*.jsonl{extension}" for extension in EXTENSIONS.values()]
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files += sorted({file for pattern in patterns for file in path.glob(pattern)})
+        else:
+            files.append(path)
+    # files saved after an error go last: their questions are kept only if no other file has them
+    return sorted(files, key=lambda file: "_error" in file.name)
+
+
+def questions_from(file: Path):
+    """
+    :return:
+    the questions in an output file, as JSON array or JSON Lines, one by one. Other JSON files are skipped
+    """
+    if ".jsonl" in file.name:
+        yield from read_records(str(file))
+        return
+
+    with open(file, 'r', encoding="utf-8") as f:
+        records = json.load(f)
+    if not isinstance(records, list):
+        Logger.warning(f"Skipping '{file}': it is not a list of questions")
+        return
+    yield from records
+
+
+def merge(paths, file_name: str, compression=None, json_array=False):
+    """
+    Merges the output files of several shards, or runs, into one dataset without duplicated questions.
+    A question found in several files is kept once: the copy with the most answers, or the first one found
+    :param paths:
+    output files, or directories with output files
+    :param file_name:
+    name of the merged JSON Lines file, without extension
+    :return:
+    the path of the merged file
+    """
+    files = output_files(paths)
+
+    # first pass: where the copy kept of each question is
+    kept = {}
+    total = 0
+    for file_index, file in enumerate(files):
+        for position, question in enumerate(questions_from(file)):
+            total += 1
+            key = (question.get('product_id'), question['id'])
+            answer_count = len(question.get('answers') or ())
+            if key not in kept or answer_count > kept[key][0]:
+                kept[key] = (answer_count, file_index, position)
+
+    keep = {(file_index, position) for _, file_index, position in kept.values()}
+
+    writer = RecordWriter(file_name, compression, fsync_every=0)
+    for file_index, file in enumerate(files):
+        for position, question in enumerate(questions_from(file)):
+            if (file_index, position) in keep:
+                writer.write(question)
+    writer.close()
+
+    Logger.log(f"Merged {total} questions from {len(files)} files into {len(kept)} questions in '{writer.path}'")
+    return to_json(writer.path) if json_array else writer.path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merges the outputs of the shards of a crawl into one dataset")
+    parser.add_argument("output", help="Name of the merged file, without extension")
+    parser.add_argument("paths", nargs='+', help="Output files, or directories with the output files of each shard")
+    parser.add_argument("--compression", choices=list(EXTENSIONS), help="Compression of the merged JSON Lines file")
+    parser.add_argument("--json", dest="json_array", action='store_true',
+                        help="Also saves the merged dataset as a JSON array")
+    args = parser.parse_args()
+
+    merge(args.paths, args.output, args.compression, args.json_array)
@@ -0,0 +1,126 @@
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+import copy
+import requests
+
+from cache import ResponseCache
+from config import config
+from metrics import metrics
+from ratelimit import RateLimiter
+
+
+class Transport:
+    """
+    HTTP transport shared by all the pages:
+    keeps connections alive in a pool, and sets headers, timeouts and compression for every request.
+    Subclasses can override get() to fetch pages some other way
+    """
+
+    def __init__(self, headers=None, pool_size=10, timeout=(10, 30), accept_encoding="gzip, deflate",
+                 limiter: RateLimiter = None, cache: ResponseCache = None, archive=None):
+        """
+        :param headers:
+        headers sent with every request
+        :param pool_size:
+        max number of connections kept alive per host
+        :param timeout:
+        (connect, read) timeouts in seconds
+        :param accept_encoding:
+        compressions negotiated with the server. If empty, lets requests pick them
+        :param limiter:
+        rate limits applied to every request. If None, the RateLimiter defaults are used
+        :param cache:
+        cache for the pages fetched. If None, every page is requested
+        :param archive:
+        ResponseArchive where the responses are kept to be extracted again later. If None, they are not kept
+        """
+        self.headers = dict(headers or {})
+        if accept_encoding:
+            self.headers['Accept-Encoding'] = accept_encoding
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.cache = cache
+        self.archive = archive
+        # page types whose cached responses are revalidated with the site even while fresh
+        self.revalidated_pages = ()
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def from_config(headers):
+        """
+        :return:
+        a new Transport with the headers provided, and the settings from the config file
+        """
+        # the archive imports this module, for its own transport
+        from archive import ResponseArchive
+
+        settings = config['transport']
+        return Transport(headers,
+                         pool_size=settings['pool-size'],
+                         timeout=(settings['connect-timeout'], settings['read-timeout']),
+                         accept_encoding=settings['accept-encoding'],
+                         limiter=RateLimiter.from_config(),
+                         cache=ResponseCache.from_config(),
+                         archive=ResponseArchive.from_config())
+
+    @property
+    def language(self):
+        return self.headers['Accept-Language']
+
+    def for_language(self, language: str):
+        """
+        :return:
+        a transport for another language, sharing the connections, rate limits, cache and archive of this one
+        """
+        transport = copy.copy(self)
+        transport.headers = {**self.headers, 'Accept-Language': language}
+        return transport
+
+    def revalidating(self, *page_types: str):
+        """
+        :return:
+        a transport that revalidates the cached pages of the types with the site, even while they are fresh,
+        sharing everything else with this one. An unchanged page costs a 304 response without content
+        """
+        transport = copy.copy(self)
+        transport.revalidated_pages = page_types
+        return transport
+
+    def get(self, url, headers=None):
+        """
+        Waits for the rate limit of the host, and requests the url
+        :param headers:
+        headers for this request only, added to the transport headers
+        :return:
+        the response for the url
+        """
+        host = urlsplit(url).netloc
+        with metrics.timer('rate-limit-wait', host=host):
+            self.limiter.acquire(host)
+
+        try:
+            with metrics.timer('network', host=host):
+                # the headers of this transport are sent with each request, as the session may be shared
+                r = self.session.get(url, headers={**self.headers, **(headers or {})}, timeout=self.timeout)
+        except requests.RequestException:
+            self.limiter.record_error(host)
+            raise
+        self.limiter.record(host, r.status_code, r.headers)
+        return r
+
+    def close(self):
+        """
+        Closes the connections, cache and archive, shared with the transports for other languages
+        """
+        self.session.close()
+        if self.cache:
+            self.cache.db.close()
+        if self.archive:
+            self.archive.close()
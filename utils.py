@@ -1,8 +1,33 @@
 import time
 
-from log import Logger
+from config import config
+from log import Logger, mark_worker_process
+from metrics import metrics
 
 
 def nap(seconds=3, activity="continuing"):
-    Logger.log(f"Taking a quick nap of {seconds} second{'s' if seconds > 1 else ''} before {activity}...")
-    time.sleep(seconds)
+    Logger.debug(f"Taking a quick nap of {seconds} second{'s' if seconds > 1 else ''} before {activity}...")
+    with metrics.timer('nap'):
+        time.sleep(seconds)
+
+
+def _start_worker_process(settings: dict):
+    # the worker process starts fresh: it takes the settings of the scrapper, and writes its log records right away
+    config.set_values(settings)
+    mark_worker_process()
+
+
+def process_pool(workers=None):
+    """
+    :return:
+    a pool of worker processes started by a fork server, or spawned where there is none, instead of forked from
+    this process: a thread of this process, e.g. a fetch thread or the log writer, could be holding a lock at the time,
+    such as the one of the metrics or of the logger, and the worker would wait for it forever.
+    The workers take the settings of this process
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method),
+                               initializer=_start_worker_process, initargs=(config.values,))
@@ -0,0 +1,160 @@
+import argparse
+import gzip
+import io
+import json
+import os
+
+from config import config
+from log import Logger
+from records import to_json_value
+
+EXTENSIONS = {'gzip': ".gz", 'zstd': ".zst"}
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the zstandard package: pip install zstandard")
+    return zstandard
+
+
+class RecordWriter:
+    """
+    Appends records to a JSON Lines file as soon as they are produced.
+    Every few records they are forced to disk, closing the compressed frame,
+    so that a crash loses at most the records written since the last checkpoint
+    """
+
+    def __init__(self, file_name: str, compression=None, fsync_every=100):
+        """
+        :param file_name:
+        name of the file without extension: .jsonl and the compression extension are added
+        :param compression:
+        None, 'gzip' or 'zstd'
+        :param fsync_every:
+        number of records written between checkpoints. If 0, records are only forced to disk on close
+        """
+        if compression not in (None, *EXTENSIONS):
+            raise ValueError(f"Compression {compression} not available")
+
+        self.file_name = file_name
+        self.compression = compression
+        self.fsync_every = fsync_every
+        self.count = 0
+
+        Logger.log(f"Writing records to '{self.path}'...")
+        self._raw = open(self.path, 'wb')
+        self._stream = self._new_stream()
+
+    @staticmethod
+    def from_config(file_name: str):
+        """
+        :return:
+        a new RecordWriter with the output settings from the config file
+        """
+        settings = config['output']
+        return RecordWriter(file_name, settings['compression'], settings['fsync-every'])
+
+    @property
+    def path(self):
+        return self.path_for(self.file_name)
+
+    def path_for(self, file_name: str):
+        return f"{file_name}.jsonl{EXTENSIONS.get(self.compression, '')}"
+
+    def _new_stream(self):
+        if self.compression == 'gzip':
+            return gzip.GzipFile(fileobj=self._raw, mode='ab')
+        if self.compression == 'zstd':
+            return import_zstandard().ZstdCompressor().stream_writer(self._raw, closefd=False)
+        return self._raw
+
+    def _end_frame(self):
+        if self.compression == 'gzip':
+            self._stream.close()
+        elif self.compression == 'zstd':
+            self._stream.flush(import_zstandard().FLUSH_FRAME)
+
+    def write(self, record):
+        self._stream.write((json.dumps(record, default=to_json_value) + "\n").encode("utf-8"))
+        self.count += 1
+
+        if self.fsync_every and self.count % self.fsync_every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Forces the records written so far to disk
+        """
+        self._end_frame()
+        if self.compression == 'gzip':
+            self._stream = self._new_stream()
+
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+
+    def close(self, suffix=""):
+        """
+        Closes the file, adding the suffix to its name if any
+        """
+        self._end_frame()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+        if suffix:
+            os.replace(self.path, self.path_for(self.file_name + suffix))
+            self.file_name += suffix
+
+        Logger.log(f"Saved {self.count} records in '{self.path}'")
+
+
+def read_records(path: str):
+    """
+    :return:
+    the records of a JSON Lines file, compressed or not, one by one.
+    A truncated last record, as left by a crash, is skipped
+    """
+    with open(path, 'rb') as raw:
+        if path.endswith(EXTENSIONS['gzip']):
+            stream = gzip.GzipFile(fileobj=raw)
+        elif path.endswith(EXTENSIONS['zstd']):
+            stream = import_zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            stream = raw
+
+        lines = io.TextIOWrapper(stream, encoding="utf-8")
+        try:
+            for line in lines:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except EOFError:
+            Logger.warning(f"'{path}' is truncated, skipping its last records")
+
+
+def to_json(path: str, json_path: str = None):
+    """
+    Converts a JSON Lines file to the JSON array format saved by default, without loading it into memory
+    :return:
+    the path of the JSON file
+    """
+    if json_path is None:
+        json_path = path[:path.index(".jsonl")] + ".json"
+
+    with open(json_path, 'w', encoding="utf-8") as f:
+        f.write("[")
+        for i, record in enumerate(read_records(path)):
+            f.write((", " if i else "") + json.dumps(record))
+        f.write("]")
+
+    return json_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts JSON Lines output files to JSON arrays")
+    parser.add_argument("files", nargs='+', help="JSON Lines files, optionally compressed (.jsonl, .jsonl.gz, .jsonl.zst)")
+    args = parser.parse_args()
+
+    for records_file in args.files:
+        Logger.log(f"Converted '{records_file}' to '{to_json(records_file)}'")